@@ -0,0 +1,23 @@
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+
+from injector import stage
+
+
+@stage('plot_family')
+def plot_family(ax, x, values, curves, cmap=plt.cm.viridis, linewidth=.3, label=None):
+    # Draw one curve per row of curves (shape (len(values), len(x))) as a single
+    # LineCollection coloured by values, so drawing cost no longer grows with one Line2D
+    # per row. Adds a colorbar labelled `label` and returns the collection.
+    curves = np.asarray(curves, dtype=float)
+    segments = np.stack(np.broadcast_arrays(np.asarray(x, dtype=float), curves), axis=-1)
+    lines = LineCollection(segments, cmap=cmap, linewidths=linewidth)
+    lines.set_array(np.asarray(values, dtype=float))
+    ax.add_collection(lines)
+    ax.autoscale_view()
+
+    cbar = ax.figure.colorbar(lines, ax=ax)
+    if label is not None:
+        cbar.set_label(label)
+    return lines
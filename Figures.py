@@ -0,0 +1,177 @@
+import argparse
+import ast
+import hashlib
+import importlib
+import json
+import os
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from importlib.metadata import version
+
+# Headless, cached rendering of the project figures. Each figure is keyed by a hash of its
+# parameters, the source of every project module it depends on, the package versions that
+# affect the numbers or the drawing, and the property backend, and written to
+# <out>/<name>-<key>.<format>. Figures whose key is unchanged are not rendered again; the
+# rest render in parallel worker processes. <out>/figures.json maps each figure to its
+# current files, e.g.
+#
+#   python Figures.py -o figures --format png svg
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MANIFEST = 'figures.json'
+# Figure name -> (module, function, keyword arguments)
+FIGURES = {
+    'VLE_diagram': ('diagrams', 'VLE_diagram', {}),
+    'plot_curves': ('NitrousDensityPlots', 'plot_curves', {'isoT': 15, 'isoP': 60}),
+    'plot_enthalpies': ('NitrousEnthalpyPlots', 'plot_enthalpies', {'isoT': 40, 'isoP': 71}),
+    'SPI_plot': ('SPICalcs', 'SPI_plot', {'orrifaces': 12, 'P_chamber': 20e5}),
+    'HEMmassflowrate': ('HEMCalcs', 'HEMmassflowrate', {'P2': 20e5}),
+    'NormalisedHEM': ('HEMCalcs', 'NormalisedHEM', {}),
+    'NHNEPlot': ('NHNECalcs', 'NHNEPlot', {'T': 30, 'N': 12, 'kap': 1.4, 'Cd': 0.6, 'Nom': 1.36}),
+}
+VERSIONED = ('CoolProp', 'numpy', 'matplotlib')
+
+
+def _local_imports(path):
+    # Project modules and packages imported by the source file at path
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split('.')[0])
+    return {name for name in names
+            if os.path.exists(os.path.join(ROOT, name + '.py')) or os.path.isdir(os.path.join(ROOT, name))}
+
+
+def _sources(module):
+    # Source files of module and every project module it imports, directly or not; a
+    # package counts as all of its files
+    files, todo, seen = set(), [module], set()
+    while todo:
+        name = todo.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        package = os.path.join(ROOT, name)
+        if os.path.isdir(package):
+            paths = [os.path.join(package, file) for file in sorted(os.listdir(package)) if file.endswith('.py')]
+        else:
+            paths = [package + '.py']
+        for path in paths:
+            files.add(path)
+            todo.extend(_local_imports(path))
+    return sorted(files)
+
+
+def figure_key(name, params=None, dpi=150):
+    # Hash of everything figure `name` depends on, for its file names
+    from injector import get_backend
+    module, function, defaults = FIGURES[name]
+    code = hashlib.sha256()
+    for path in _sources(module):
+        with open(path, 'rb') as f:
+            code.update(os.path.relpath(path, ROOT).encode() + b'\0' + f.read())
+    key = {'name': name, 'function': f'{module}.{function}', 'params': dict(defaults, **(params or {})),
+           'dpi': dpi, 'code': code.hexdigest(), 'backend': get_backend(),
+           'versions': {package: version(package) for package in VERSIONED}}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _render(module, function, params, base, formats, dpi):
+    # Runs in a worker process: draw the figure headless and write one file per format
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    warnings.simplefilter('ignore')  # plt.show() on Agg, and CoolProp failures already marked NaN
+
+    t = time.perf_counter()
+    plt.close('all')
+    getattr(importlib.import_module(module), function)(**params)
+    figure = plt.gcf()
+    for fmt in formats:
+        tmp = f'{base}.tmp{os.getpid()}.{fmt}'
+        figure.savefig(tmp, format=fmt, dpi=dpi, bbox_inches='tight')
+        os.replace(tmp, f'{base}.{fmt}')  # files only appear once complete
+    plt.close('all')
+    return time.perf_counter() - t
+
+
+def build_figures(names=None, out='figures', formats=('png',), params=None, dpi=150, workers=None, force=False):
+    # Render the named figures (all of FIGURES by default) to out, skipping any whose files
+    # for this key already exist unless force. params maps a figure name to keyword
+    # arguments overriding its defaults. Returns {name: (files, seconds or None if cached)}
+    # and updates the manifest.
+    names = list(FIGURES) if names is None else list(names)
+    params = params or {}
+    os.makedirs(out, exist_ok=True)
+    manifest_path = os.path.join(out, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    results, todo = {}, {}
+    for name in names:
+        if name not in FIGURES:
+            raise ValueError(f"unknown figure {name!r}, expected one of {', '.join(FIGURES)}")
+        base = os.path.join(out, f'{name}-{figure_key(name, params.get(name), dpi)}')
+        files = [f'{base}.{fmt}' for fmt in formats]
+        if not force and all(os.path.exists(file) for file in files):
+            results[name] = (files, None)
+        else:
+            todo[name] = (base, files)
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers or min(len(todo), os.cpu_count() or 1)) as pool:
+            futures = {}
+            for name, (base, files) in todo.items():
+                module, function, defaults = FIGURES[name]
+                futures[pool.submit(_render, module, function, dict(defaults, **params.get(name, {})),
+                                    base, formats, dpi)] = name
+            for future in as_completed(futures):
+                name = futures[future]
+                results[name] = (todo[name][1], future.result())
+
+    for name, (files, _) in results.items():
+        # Files of earlier keys for this figure are stale
+        previous = manifest.get(name, {}).get('files', [])
+        for file in previous:
+            if os.path.basename(file) not in {os.path.basename(f) for f in files}:
+                try:
+                    os.remove(os.path.join(out, file))
+                except FileNotFoundError:
+                    pass
+        manifest[name] = {'files': [os.path.basename(file) for file in files],
+                          'params': dict(FIGURES[name][2], **params.get(name, {}))}
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render the project figures headless, reusing unchanged ones')
+    parser.add_argument('names', nargs='*', help=f"figures to render (default all: {', '.join(FIGURES)})")
+    parser.add_argument('-o', '--out', default='figures', help='output directory')
+    parser.add_argument('--format', nargs='+', default=['png'], choices=['png', 'svg', 'pdf'])
+    parser.add_argument('--dpi', type=int, default=150)
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per figure, up to one per CPU)')
+    parser.add_argument('--force', action='store_true', help='render even when the files are up to date')
+    args = parser.parse_args(argv)
+
+    try:
+        results = build_figures(args.names or None, args.out, args.format, dpi=args.dpi,
+                                workers=args.workers, force=args.force)
+    except ValueError as error:
+        raise SystemExit(f'error: {error}') from None
+    for name, (files, seconds) in results.items():
+        status = 'cached' if seconds is None else f'rendered in {seconds:.2f} s'
+        print(f"{name:20s} {status:22s} {', '.join(os.path.basename(file) for file in files)}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,62 +1,38 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import CoolProp.CoolProp as CP
-from matplotlib.cm import ScalarMappable
-from matplotlib.colors import Normalize
 from mpl_toolkits.mplot3d import Axes3D
 
-def A(d):
-    return np.pi * (d / 2) ** 2
-
-def mHEM(A, rho2, h1, h2, N, Cd=0.66):
-        return N * A * Cd * rho2 * np.sqrt(2*(h1 - h2))
+from injector import A, mHEM, HEM_CP, mass_flow_grid, stage
+from CurveFamily import plot_family
 
 
 T1 = 10 # Upstream temperature (C)
 P2 = 20e5 # Downstream pressure (Pa)
 N = 12 # Number of orrifaces
 
-def HEM_CP(T1, P2, subst='NitrousOxide'):
-    h1 = CP.PropsSI('H', 'T', T1 + 273.15, 'Q', 0, subst)
-    s1 = CP.PropsSI('S', 'T', T1 + 273.15, 'Q', 0, subst)
-
-    # Find downstream enthalpy for liquid with upstream entropy and downstream pressure
-    h2 = CP.PropsSI('H', 'P', P2, 'S', s1, subst)
-
-    rho2 = CP.PropsSI('D', 'P', P2, 'S', s1, subst)
-    return h1, h2, rho2
-
+@stage('HEMCalcs.plotting')
 def plotting(d, T, N, Cd=0.66):
     h1, h2, rho2 = HEM_CP(T, P2)
+    return mHEM(A(d), rho2, h1, h2, N, Cd)
 
-    m_HEM_vectorized = np.vectorize(mHEM)
-    return m_HEM_vectorized(A(d), rho2, h1, h2, N, Cd)
-
-def HEMmassflowrate():
+@stage('HEMmassflowrate')
+def HEMmassflowrate(P2=P2):
     temps = np.linspace(-10, 32, 500)
     d = np.linspace(0.1, 2.5, 100) / 1000
 
 
-    plt.figure()
-    # set colors to viridis colormap
-    colormap = plt.cm.viridis
-    color = iter(colormap(np.linspace(0, 1, len(temps))))
-
-    for T in temps:
-        m = plotting(d, T, N)
-        plt.plot(d * 1000, m, label=f'{T:.1f} C', color=next(color), linewidth=.3, alpha=1)
+    # Mass flow for every temperature and diameter in one call, shape (T, d)
+    masses = mass_flow_grid(temps, P2, d, N, models=('HEM',))['HEM'].values
 
-    sm = ScalarMappable(cmap=colormap, norm=Normalize(vmin=min(temps), vmax=max(temps)))
-    sm.set_array([])
-    ax = plt.gca()
-    cbar = plt.colorbar(sm, ax=ax)
-    cbar.set_label('Upstream Temperature (C)')
+    plt.figure()
+    plot_family(plt.gca(), d * 1000, temps, masses, linewidth=.3, label='Upstream Temperature (C)')
     plt.xlabel('Diameter (mm)')
     plt.ylabel('Mass Flow Rate (kg/s)')
     plt.title('Mass Flow Rate vs Diameter vs Temperature')
     plt.show()
 
 
+@stage('NormalisedHEM')
 def NormalisedHEM():
     # Plot Mass Flow Rate vs Upstream temperature for d =0.5mm and N = 1
     temps = np.linspace(-10, 70, 500)
@@ -0,0 +1,146 @@
+import asyncio
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import ipywidgets as widgets
+import matplotlib
+import matplotlib.pyplot as plt
+from IPython.display import clear_output, display
+
+
+class DebouncedRunner:
+    # Runs view.compute(**params) on a background thread and view.render(data) back on the
+    # thread that submitted them: through its asyncio loop when there is one (the notebook
+    # kernel's), otherwise when that thread next calls wait(). Matplotlib artists are
+    # therefore never touched off that thread. Submissions within `delay` seconds of each
+    # other are merged into the last, queued work that has been superseded is cancelled
+    # before it starts, and results of superseded work are dropped, so only the latest
+    # parameters are ever drawn.
+    def __init__(self, compute, render, delay=0.15):
+        self.compute = compute
+        self.render = render
+        self.delay = delay
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._timer = None
+        self._future = None
+        self._loop = None
+        self._result = None
+
+    def submit(self, **params):
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._loop = None
+        with self._lock:
+            self._generation += 1
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.delay, self._start, (self._generation, params))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _current(self, generation):
+        with self._lock:
+            return generation == self._generation
+
+    def _start(self, generation, params):
+        with self._lock:
+            if generation != self._generation:
+                return
+            if self._future is not None:
+                self._future.cancel()  # only succeeds if it has not started yet
+            self._future = self._executor.submit(self._run, generation, params)
+
+    def _run(self, generation, params):
+        if not self._current(generation):
+            return
+        data = self.compute(**params)
+        if not self._current(generation):
+            return
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._finish, generation, data)
+        else:
+            with self._lock:
+                self._result = (generation, data)  # rendered by wait() on the submitting thread
+
+    def _finish(self, generation, data):
+        # Parameters may have moved on again while the result was in flight
+        if self._current(generation):
+            self.render(data)
+
+    def wait(self):
+        # Block until the latest submission has been computed, for scripts and tests. Without
+        # an event loop its render runs here, so call this from the submitting thread;
+        # otherwise the render is left to the loop.
+        while True:
+            with self._lock:
+                timer, generation = self._timer, self._generation
+            if timer is not None:
+                timer.join()
+            with self._lock:
+                future = self._future
+            if future is not None:
+                try:
+                    future.result()
+                except CancelledError:
+                    pass
+            if self._current(generation):
+                with self._lock:
+                    result, self._result = self._result, None
+                if result is not None:
+                    self._finish(*result)
+                return
+
+    def close(self):
+        with self._lock:
+            self._generation += 1
+            if self._timer is not None:
+                self._timer.cancel()
+        self._executor.shutdown(wait=False)
+
+
+def widget_backend():
+    # True when figures are live ipympl canvases (%matplotlib widget) that redraw in place
+    return 'ipympl' in matplotlib.get_backend()
+
+
+def link_sliders(view, delay=0.15, **sliders):
+    # Recompute view with every slider's value whenever one of them moves, and return the
+    # sliders in a VBox to display. The view's compute() runs in the background through a
+    # DebouncedRunner, kept on the VBox as .runner, and only the latest slider values are
+    # drawn. With %matplotlib widget (ipympl) view.fig is a live figure that render() moves
+    # the artists of in place, asking for a redraw once view.redraw is set; views set it
+    # after their first render, which is drawn along with the new figure. Without ipympl the
+    # figure is closed to pyplot and shown as an image below the sliders instead, replaced
+    # after every render.
+    render = view.render
+    output = None
+    if not widget_backend():
+        output = widgets.Output()
+        plt.close(view.fig)  # otherwise the inline backend shows it again at the end of the cell
+        with output:
+            display(view.fig)
+
+        def render(data):
+            view.render(data)
+            with output:
+                clear_output(wait=True)
+                display(view.fig)
+    runner = DebouncedRunner(view.compute, render, delay)
+
+    def on_change(change):
+        runner.submit(**{name: slider.value for name, slider in sliders.items()})
+
+    for slider in sliders.values():
+        slider.observe(on_change, names='value')
+    box = widgets.VBox(list(sliders.values()) + ([output] if output is not None else []))
+    box.runner = runner
+    return box
+
+
+def show_artist(artist, visible, label):
+    # Show or hide an artist, keeping hidden ones out of the legend
+    artist.set_visible(visible)
+    artist.set_label(label if visible else '_' + label)
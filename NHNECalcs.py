@@ -1,48 +1,107 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import CoolProp.CoolProp as CP
 import ipywidgets as widgets
 
-from HEMCalcs import plotting, A
-from SPICalcs import CalcSPI, m_CPI
+from injector import dyer_kappa, mass_flow_grid, size_orifices, stage
+from Interactive import link_sliders
 
-def NHNEPlot(T, N, kap, Cd, Nom):
-    d = np.linspace(0.1, 6, 1000) / 1000
-    Pc = 20e5
+class NHNEView:
+    # NHNEPlot drawn once on ax (the current axes by default); update() recomputes the mass
+    # flows and moves the existing lines and markers instead of redrawing the figure.
+    # kap='dyer' uses Dyer's kappa at the operating point, which needs the upstream pressure
+    # P1 (Pa) of a supercharged tank; P1=None is a self-pressurised tank at the vapour pressure.
+    def __init__(self, T=30, N=12, kap=1.4, Cd=0.6, Nom=1.36, Pc=20e5, P1=None, ax=None):
+        self.redraw = False
+        self.ax = plt.gca() if ax is None else ax
+        self.fig = self.ax.figure
+        self.d = np.linspace(0.1, 6, 1000) / 1000
 
-    mNom = Nom
-    mHEM = plotting(d, T, N, Cd)  # remove Cd=Cd
-    mSPI = CalcSPI(T, 'NitrousOxide', Pc, N, d, Cd)[0]
-    mkappa = ((kap / (1 + kap)) * mSPI) + (1/(1 + kap) * mHEM)
+        self.HEM, = self.ax.plot([], [])
+        self.SPI, = self.ax.plot([], [])
+        self.kappa, = self.ax.plot([], [])
+        self.design = self.ax.axhline(Nom, color='r', linestyle='--')
+        self.band = None
 
-    plt.plot(d * 1000, mHEM, label=r'$\dot{m}_{HEM}$')
-    plt.plot(d * 1000, mSPI, label=r'$\dot{m}_{SPI}$')
-    plt.plot(d * 1000, mkappa, label=f'$\\dot{{m}}_{{\\kappa}}$, $\\kappa={kap}$')
-    plt.axhline(mNom, color='r', linestyle='--', label=f'$\\dot{{m}}_{{Design}}={mNom}$ kg/s')
+        self.d_HEM, = self.ax.plot([], [], color='tab:blue', marker='o')
+        self.d_SPI, = self.ax.plot([], [], color='tab:orange', marker='o')
+        self.d_kappa, = self.ax.plot([], [], color='tab:green', marker='o')
+        self.ax.set_xlabel('Diameter (mm)')
+        self.ax.set_ylabel('Mass Flow Rate (kg/s)')
+        self.ax.set_xlim(0, 3.5)
+        self.ax.set_ylim(0, 2)
+        self.update(T, N, kap, Cd, Nom, Pc, P1)
+        self.fig.tight_layout()
+        self.redraw = True
 
-    plt.fill_between(d * 1000, mHEM, mSPI, color='lightgrey', alpha=0.5)
+    @stage('NHNEView.compute')
+    def compute(self, T=30, N=12, kap=1.4, Cd=0.6, Nom=1.36, Pc=20e5, P1=None):
+        # Mass flows and design diameters for update(), safe to run off the main thread
+        d = self.d
 
-    idx_HEM = np.argmin(np.abs(mHEM - mNom))
-    idx_SPI = np.argmin(np.abs(mSPI - mNom))
-    idx_kappa = np.argmin(np.abs(mkappa - mNom))
+        masses = mass_flow_grid(T, Pc, d, N, Cd, kap, P1=P1)
 
-    d_HEM = d[idx_HEM] * 1000
-    d_SPI = d[idx_SPI] * 1000
-    d_kappa = d[idx_kappa] * 1000
+        # Design diameters from inverting m = N * Cd * A(d) * G for each model
+        d_HEM, d_SPI, d_kappa = (diameter * 1000 for diameter in size_orifices(Nom, T, Pc, N, Cd, kap, P1=P1))
+        if kap == 'dyer':
+            kap = f'{float(dyer_kappa(T, Pc, P1)):.2f}'  # Dyer's kappa at this operating point, for the legend
+        return {'T': T, 'N': N, 'kap': kap, 'Nom': Nom,
+                'mHEM': masses['HEM'].values, 'mSPI': masses['SPI'].values, 'mkappa': masses['NHNE'].values,
+                'd_HEM': d_HEM, 'd_SPI': d_SPI, 'd_kappa': d_kappa}
 
-    plt.plot(d_HEM, mNom, color='tab:blue', marker='o', label=f'$d_{{HEM}}={d_HEM:.2f}$ mm')
-    plt.plot(d_SPI, mNom, color='tab:orange', marker='o', label=f'$d_{{SPI}}={d_SPI:.2f}$ mm')
-    plt.plot(d_kappa, mNom, color='tab:green', marker='o', label=f'$d_{{\\kappa}}={d_kappa:.2f}$ mm')
-    plt.xlabel('Diameter (mm)')
-    plt.ylabel('Mass Flow Rate (kg/s)')
-    plt.title(f'Mass Flow Rate vs Diameter\n {N} Orifices at $T_{{tank}} =${T:.2f}°C')
-    plt.xlim(0, 3.5)
-    plt.ylim(0, 2)
-    plt.tight_layout()
-    plt.legend()
+    @stage('NHNEView.render')
+    def render(self, data):
+        d = self.d
+        T, N, kap, mNom = data['T'], data['N'], data['kap'], data['Nom']
+        mHEM, mSPI, mkappa = data['mHEM'], data['mSPI'], data['mkappa']
 
+        self.HEM.set_data(d * 1000, mHEM)
+        self.HEM.set_label(r'$\dot{m}_{HEM}$')
+        self.SPI.set_data(d * 1000, mSPI)
+        self.SPI.set_label(r'$\dot{m}_{SPI}$')
+        self.kappa.set_data(d * 1000, mkappa)
+        self.kappa.set_label(f'$\\dot{{m}}_{{\\kappa}}$, $\\kappa={kap}$')
+        self.design.set_ydata([mNom, mNom])
+        self.design.set_label(f'$\\dot{{m}}_{{Design}}={mNom}$ kg/s')
 
-# Create sliders for the temperature, the number of orifices and the kappa value
+        # fill_between has no set_data, so the band is replaced
+        if self.band is not None:
+            self.band.remove()
+        self.band = self.ax.fill_between(d * 1000, mHEM, mSPI, color='lightgrey', alpha=0.5)
+
+        d_HEM, d_SPI, d_kappa = data['d_HEM'], data['d_SPI'], data['d_kappa']
+        self.d_HEM.set_data([d_HEM], [mNom])
+        self.d_HEM.set_label(f'$d_{{HEM}}={d_HEM:.2f}$ mm')
+        self.d_SPI.set_data([d_SPI], [mNom])
+        self.d_SPI.set_label(f'$d_{{SPI}}={d_SPI:.2f}$ mm')
+        self.d_kappa.set_data([d_kappa], [mNom])
+        self.d_kappa.set_label(f'$d_{{\\kappa}}={d_kappa:.2f}$ mm')
+        self.ax.set_title(f'Mass Flow Rate vs Diameter\n {N} Orifices at $T_{{tank}} =${T:.2f}°C')
+        # The legend sits inside the axes, so tight_layout need not lay out its mathtext
+        self.ax.legend().set_in_layout(False)
+        if self.redraw:
+            self.fig.canvas.draw_idle()
+
+    def update(self, T=30, N=12, kap=1.4, Cd=0.6, Nom=1.36, Pc=20e5, P1=None):
+        self.render(self.compute(T, N, kap, Cd, Nom, Pc, P1))
+
+def NHNEPlot(T, N, kap, Cd, Nom, Pc=20e5):
+    # Pc is the chamber pressure (Pa), e.g. from injector.chamber_pressure for this geometry.
+    # Under widgets.interactive pass the Pc slider from NHNESliders, or widgets.fixed(Pc),
+    # otherwise ipywidgets makes an unbounded slider for it.
+    NHNEView(T, N, kap, Cd, Nom, Pc)
+
+def NHNEInteractive():
+    # NHNEView driven by the NHNE sliders (see link_sliders), returns (view, sliders)
+    T_slider, N_slider, kap_slider, Cd_slider, Nom_slider, Pc_slider = NHNESliders()
+    plt.figure()
+    view = NHNEView(T_slider.value, N_slider.value, kap_slider.value, Cd_slider.value, Nom_slider.value,
+                    Pc_slider.value)
+    return view, link_sliders(view, T=T_slider, N=N_slider, kap=kap_slider, Cd=Cd_slider, Nom=Nom_slider,
+                              Pc=Pc_slider)
+
+
+# Create sliders for the temperature, the number of orifices, the kappa value and the
+# chamber pressure (Pa)
 def NHNESliders():
     T_slider = widgets.FloatSlider(
         value=30,
@@ -85,5 +144,14 @@ def NHNESliders():
         description=f'mass',
         continuous_update=False
     )
-    return T_slider, N_slider, kap_slider, Cd_slider, Nom_slider
+    Pc_slider = widgets.FloatSlider(
+        value=20e5,
+        min=5e5,
+        max=60e5,
+        step=0.5e5,
+        description='Pc (Pa)',
+        readout_format='.3s',
+        continuous_update=False
+    )
+    return T_slider, N_slider, kap_slider, Cd_slider, Nom_slider, Pc_slider
 
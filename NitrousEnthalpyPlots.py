@@ -1,39 +1,34 @@
-import CoolProp.CoolProp as CP
 import matplotlib.pyplot as plt
 import numpy as np
 import ipywidgets as widgets
-from IPython.display import display
 from matplotlib.ticker import FuncFormatter
 
+from injector import fluid_constant, isoline, props, saturation_table, stage
+from Interactive import link_sliders, show_artist
+
 # Define the subst
 subst = 'NitrousOxide'
 
 # Define temperature range (in Kelvin)
-T_min = CP.PropsSI(subst, 'Tmin') + 0.01  # slightly above the minimum temperature
-T_max = CP.PropsSI(subst, 'Tcrit')        # critical temperature
+T_min = fluid_constant(subst, 'Tmin') + 0.01  # slightly above the minimum temperature
+T_max = fluid_constant(subst, 'Tcrit')        # critical temperature
 temperatures = np.linspace(T_min, T_max, int(1e3))
 
+@stage('NitrousEnthalpyPlots.get_saturations')
 def get_saturations(T):
-    liquid_enthalpy = []
-    vapor_enthalpy = []
-    saturation_pressures = []
-
-    # Calculate densities and pressures at each temperature
-    for T in temperatures:
-        lh = CP.PropsSI('H', 'T', T, 'Q', 0, subst)  # liquid enthalpy
-        vh = CP.PropsSI('H', 'T', T, 'Q', 1, subst)  # vapor enthalpy
-        psat = CP.PropsSI('P', 'T', T, 'Q', 0, subst) # saturation pressure
+    sat = saturation_table(subst)
 
-        liquid_enthalpy.append(lh)
-        vapor_enthalpy.append(vh)
-        saturation_pressures.append(psat)
+    # Look up enthalpies and pressures at each temperature
+    liquid_enthalpy = sat('Hl', T)      # liquid enthalpy
+    vapor_enthalpy = sat('Hv', T)       # vapor enthalpy
+    saturation_pressures = sat('P', T)  # saturation pressure
 
     return liquid_enthalpy, vapor_enthalpy, saturation_pressures
 
 def find_critical(subst):
-    T_critical = CP.PropsSI('Tcrit', subst)
-    P_critical = CP.PropsSI('Pcrit', subst)
-    H_critical = CP.PropsSI('H', 'T', T_critical, 'P', P_critical, subst)
+    T_critical = fluid_constant(subst, 'Tcrit')
+    P_critical = fluid_constant(subst, 'Pcrit')
+    H_critical = float(props('H', 'T', T_critical, 'P', P_critical, subst))
     return T_critical, P_critical, H_critical
 
 def enthaly_temperature_plot(ax, subst, temperatures):
@@ -55,24 +50,43 @@ def enthaly_temperature_plot(ax, subst, temperatures):
     ax.set_ylabel('Enthalpy (kJ/kg)')
     ax.set_title('Enthalpy vs Temperature')
 
-def isobar_plot(ax, subst, isoP):
-    P = isoP * 1e5
-    T = np.linspace(260,370, 500)
-    h = CP.PropsSI('H', 'P', P, 'T', T, subst) * 1e-3
-    ax.plot(T- 273.15, h, label=f'Isobar at {isoP:.1f} bar')
-
-    try:
-        hv = CP.PropsSI('H', 'P', P, 'Q', 1, subst) * 1e-3
-        hl = CP.PropsSI('H', 'P', P, 'Q', 0, subst) * 1e-3
-        tv = CP.PropsSI('T', 'P', P, 'Q', 1, subst) - 273.15
-        tl = CP.PropsSI('T', 'P', P, 'Q', 0, subst) - 273.15
+def isobar_artists(ax):
+    # Isobar line, saturation temperature line and saturation points, placed by set_isobar
+    line, = ax.plot([], [])
+    T_sat_line = ax.axvline(0, color='gray', linestyle='--')
+    vapour, = ax.plot([], [], 'ro')
+    liquid, = ax.plot([], [], 'bo')
+    return line, T_sat_line, vapour, liquid
 
+def isobar_data(subst, isoP):
+    # Isobar and saturation points for set_isobar, in °C and kJ/kg
+    P = isoP * 1e5
+    line = isoline('H', 'P', P, 'T', 260, 370, subst)
+
+    sat = saturation_table(subst)
+    T_sat = sat.T_sat(P)
+    return {'isoP': isoP, 'T': line.x - 273.15, 'h': line.y * 1e-3, 'T_sat': T_sat - 273.15,
+            'hv': sat('Hv', T_sat) * 1e-3, 'hl': sat('Hl', T_sat) * 1e-3}
+
+def set_isobar(artists, data):
+    line, T_sat_line, vapour, liquid = artists
+    line.set_data(data['T'], data['h'])
+    line.set_label(f'Isobar at {data["isoP"]:.1f} bar')
+
+    # Saturation points, hidden above the critical pressure
+    hv, hl = data['hv'], data['hl']
+    tv = tl = data['T_sat']
+
+    below_critical = bool(np.isfinite(tv))
+    T_sat_line.set_xdata([tv, tv])
+    vapour.set_data([tv], [hv])
+    liquid.set_data([tl], [hl])
+    show_artist(T_sat_line, below_critical, f'$T_{{sat}}$ = {tv:.1f} °C')
+    show_artist(vapour, below_critical, f'$h_{{v}}$ = {hv:.1f} kg/m$^3$')
+    show_artist(liquid, below_critical, f'$h_{{l}}$ = {hl:.1f} kg/m$^3$')
 
-        ax.axvline(tv, color='gray', linestyle='--', label=f'$T_{{sat}}$ = {tv:.1f} °C')
-        ax.plot(tv, hv, 'ro', label=f'$h_{{v}}$ = {hv:.1f} kg/m$^3$')
-        ax.plot(tl, hl, 'bo', label=f'$h_{{l}}$ = {hl:.1f} kg/m$^3$')
-    except:
-        pass
+def isobar_plot(ax, subst, isoP):
+    set_isobar(isobar_artists(ax), isobar_data(subst, isoP))
 
 def enthaly_pressure_plot(ax, subst, temperatures):
     liquid_enthalpy, vapor_enthalpy, saturation_pressures = get_saturations(temperatures)
@@ -93,46 +107,91 @@ def enthaly_pressure_plot(ax, subst, temperatures):
     ax.set_ylabel('Enthalpy (kJ/kg)')
     ax.set_title('Enthalpy vs Pressure')
 
-def isotherm_plot(ax, subst, isoT):
-    T = isoT + 273.15
-    P = np.linspace(1, 90, 500) * 1e5
-    h = CP.PropsSI('H', 'P', P, 'T', T, subst) * 1e-3
-    ax.plot(P * 1e-5, h, color='tab:green',label=f'Isobar at {isoT:.1f} °C')
-
-    try:
-        hv = CP.PropsSI('H', 'P', P, 'Q', 1, subst) * 1e-3
-        hl = CP.PropsSI('H', 'P', P, 'Q', 0, subst) * 1e-3
-        pv = CP.PropsSI('P', 'T', T, 'Q', 1, subst) * 1e-5  # Calculate the saturation pressure at the isothermal temperature
+def isotherm_artists(ax):
+    # Isotherm line, saturation pressure line and saturation points, placed by set_isotherm
+    line, = ax.plot([], [], color='tab:green')
+    P_sat_line = ax.axvline(0, color='gray', linestyle='--')
+    vapour, = ax.plot([], [], 'ro')
+    liquid, = ax.plot([], [], 'bo')
+    return line, P_sat_line, vapour, liquid
 
-        # Find the index where P is closest to pv
-        idx = (np.abs(P*1e-5 - pv)).argmin()
-
-        # Extract the corresponding values of hv and hl
-        hv_at_pv = hv[idx]
-        hl_at_pv = hl[idx]
+def isotherm_data(subst, isoT):
+    # Isotherm and saturation points for set_isotherm, in bar and kJ/kg
+    T = isoT + 273.15
+    line = isoline('H', 'T', T, 'P', 1e5, 90e5, subst)
+
+    sat = saturation_table(subst)
+    return {'isoT': isoT, 'P': line.x * 1e-5, 'h': line.y * 1e-3, 'P_sat': sat('P', T) * 1e-5,
+            'hv': sat('Hv', T) * 1e-3, 'hl': sat('Hl', T) * 1e-3}
+
+def set_isotherm(artists, data):
+    line, P_sat_line, vapour, liquid = artists
+    line.set_data(data['P'], data['h'])
+    line.set_label(f'Isobar at {data["isoT"]:.1f} °C')
+
+    # Saturation points at the isotherm's saturation pressure, hidden above the critical temperature
+    pv = data['P_sat']
+    hv_at_pv = data['hv']
+    hl_at_pv = data['hl']
+
+    below_critical = bool(np.isfinite(pv))
+    P_sat_line.set_xdata([pv, pv])
+    vapour.set_data([pv], [hv_at_pv])
+    liquid.set_data([pv], [hl_at_pv])
+    show_artist(P_sat_line, below_critical, '_P_sat')
+    show_artist(vapour, below_critical, f'$h_{{v}}$ = {hv_at_pv:.1f} kJ/kg')
+    show_artist(liquid, below_critical, f'$h_{{l}}$ = {hl_at_pv:.1f} kJ/kg')
 
-        ax.axvline(pv, color='gray', linestyle='--')
-        ax.plot(pv, hv_at_pv, 'ro', label=f'$h_{{v}}$ = {hv_at_pv:.1f} kJ/kg')
-        ax.plot(pv, hl_at_pv, 'bo', label=f'$h_{{l}}$ = {hl_at_pv:.1f} kJ/kg')
-    except:
-        pass
+def isotherm_plot(ax, subst, isoT):
+    set_isotherm(isotherm_artists(ax), isotherm_data(subst, isoT))
+
+class EnthalpyView:
+    # plot_enthalpies figure kept between slider moves: the saturation dome is drawn once and
+    # update() only moves the isobar, the isotherm and their saturation points
+    def __init__(self, isoT=40, isoP=71):
+        self.redraw = False
+        self.fig, axs = plt.subplots(1, 2, figsize=(15, 6), sharey=True)
+        self.axs = axs
+
+        # Plot enthalpy vs temperature
+        enthaly_temperature_plot(axs[0], subst, temperatures)
+        self.isobar = isobar_artists(axs[0])
+
+        # Plot enthalpy vs pressure
+        enthaly_pressure_plot(axs[1], subst, temperatures)
+        self.isotherm = isotherm_artists(axs[1])
+
+        axs[0].set_xlim(-10, 60)
+        axs[1].set_xlim(0, 90)
+        plt.suptitle(f'$N_{2}O$ Enthalpy Curves', fontsize=20)
+        self.update(isoT, isoP)
+        self.redraw = True
+
+    @stage('EnthalpyView.compute')
+    def compute(self, isoT=40, isoP=71):
+        # Isoline data for update(), safe to run off the main thread
+        return {'isobar': isobar_data(subst, isoP), 'isotherm': isotherm_data(subst, isoT)}
+
+    @stage('EnthalpyView.render')
+    def render(self, data):
+        set_isobar(self.isobar, data['isobar'])
+        set_isotherm(self.isotherm, data['isotherm'])
+        self.axs[0].legend(loc = 'lower right')
+        self.axs[1].legend(loc = 'lower right')
+        if self.redraw:
+            self.fig.canvas.draw_idle()
+
+    def update(self, isoT=40, isoP=71):
+        self.render(self.compute(isoT, isoP))
 
 def plot_enthalpies(isoT=40, isoP=71):
-    fig, axs = plt.subplots(1, 2, figsize=(15, 6), sharey=True)
-
-    # Plot enthalpy vs temperature
-    enthaly_temperature_plot(axs[0], subst, temperatures)
-    isobar_plot(axs[0], subst, isoP)
-
-    # Plot enthalpy vs pressure
-    enthaly_pressure_plot(axs[1], subst, temperatures)
-    isotherm_plot(axs[1], subst, isoT)
+    EnthalpyView(isoT, isoP)
 
-    axs[0].set_xlim(-10, 60)
-    axs[1].set_xlim(0, 90)
-    axs[0].legend(loc = 'lower right')
-    axs[1].legend(loc = 'lower right')
-    plt.suptitle(f'$N_{2}O$ Enthalpy Curves', fontsize=20)
+def enthalpy_view():
+    # EnthalpyView driven by the enthalpy sliders (see link_sliders), returns (view, sliders)
+    isoT_slider, isoP_slider = enthalpy_sliders()
+    view = EnthalpyView(isoT_slider.value, isoP_slider.value)
+    return view, link_sliders(view, isoT=isoT_slider, isoP=isoP_slider)
 
 
 def enthalpy_sliders():
@@ -1,50 +1,26 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from matplotlib.cm import ScalarMappable
-from matplotlib.colors import Normalize
-import CoolProp.CoolProp as CP
 
-def A(d):
-    return np.pi * (d / 2)**2
-def m_CPI(A, rho0, P1, P2, N, Cd=0.66):
-    return A * Cd * N * np.sqrt(2 * rho0 * (P2 - P1))
-def CalcSPI(T, substance, P_chamber, N, d, Cd=0.66):
-    P_sat = CP.PropsSI('P', 'T', T + 273.15, 'Q', 0, substance) / 1e5
-    D_sat = CP.PropsSI('D', 'T', T + 273.15, 'Q', 0, substance)
-    m_CPI_vectorized = np.vectorize(m_CPI)
-    return m_CPI_vectorized(A(d), D_sat, P_sat, P_chamber, N, Cd), P_sat, D_sat
+from injector import CalcSPI, fluid_constant, mass_flow_grid, stage
+from CurveFamily import plot_family
 
-def SPI_plot(orrifaces=12):
+@stage('SPI_plot')
+def SPI_plot(orrifaces=12, P_chamber=20e5):
     # Find critical temperature of N2O
-    T_critical = CP.PropsSI('Tcrit', 'NitrousOxide') - 273.15
+    T_critical = fluid_constant('NitrousOxide', 'Tcrit') - 273.15
     T_critical -= 0.01
 
     # Define the subst
     substance = 'NitrousOxide'
     temperatures = np.linspace(-15, T_critical, 2000)    # Ambient temperatures (C)
-    P_chamber = 20e5
     N = orrifaces
     d = np.linspace(0.1, 2.5, 100) / 1000
 
-    def plot_masses(T, substance, P_chamber, N, d):
-        m, P_sat, D_sat = CalcSPI(T, substance, P_chamber, N, d)
-        plt.plot(d * 1000, m, label=f'{T:.1f} C', color=next(color), linewidth=.1, alpha=1)
-    plt.figure()
-    # set colors to viridis colormap
-    colormap = plt.cm.viridis
-    color = iter(colormap(np.linspace(0, 1, len(temperatures))))
-
-
+    # Mass flow for every temperature and diameter in one call, shape (T, d)
+    masses = mass_flow_grid(temperatures, P_chamber, d, N, subst=substance, models=('SPI',))['SPI'].values
 
-    for T in temperatures:
-        # VLE
-        plot_masses(T, substance, P_chamber, N, d)
-
-    sm = ScalarMappable(cmap=colormap, norm=Normalize(vmin=min(temperatures), vmax=max(temperatures)))
-    sm.set_array([])
-    ax = plt.gca()
-    cbar = plt.colorbar(sm, ax=ax)
-    cbar.set_label('Upstream Temperature (C)')
+    plt.figure()
+    plot_family(plt.gca(), d * 1000, temperatures, masses, linewidth=.1, label='Upstream Temperature (C)')
 
     # Use Calculate CPI to find mass flow rates for just critical temperature
     m, P_sat, D_sat = CalcSPI(T_critical, substance, P_chamber, N, d)
@@ -0,0 +1,190 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+import warnings
+from contextlib import contextmanager
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import injector
+import injector.cache
+import HEMCalcs
+import SPICalcs
+import NHNECalcs
+import NitrousDensityPlots
+import NitrousEnthalpyPlots
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+# A case is reported as a regression when it is this many times slower than the baseline,
+# and also more than SLACK seconds slower, so scheduler noise on sub-millisecond cases is not
+TOLERANCE = 1.5
+SLACK = 2e-3
+# Results entry holding the speed of the machine itself, see calibrate
+CALIBRATION = 'calibration'
+
+
+@contextmanager
+def count_coolprop():
+    # Count evaluations by the property backend (table lookups are not counted) and the number
+    # of states they cover
+    counts = {'calls': 0, 'points': 0}
+    with injector.profile(max_events=0) as profile:
+        yield counts
+    for calls, points, _ in profile.properties.values():
+        counts['calls'] += calls
+        counts['points'] += points
+
+
+def measure(func, repeat=3):
+    # Median wall time of `repeat` runs after a warm-up run, so it does not depend on repeat,
+    # then property counts and peak traced memory of one more run
+    func()
+    plt.close('all')
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t)
+        plt.close('all')
+
+    with count_coolprop() as counts:
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    plt.close('all')
+    return {'seconds': float(np.median(times)), 'coolprop_calls': counts['calls'],
+            'coolprop_points': counts['points'], 'peak_bytes': peak}
+
+
+def calibrate(repeat=21):
+    # Median time of a fixed NumPy and pure-Python workload, measured before and after the
+    # cases. Shared machines drift in speed by tens of percent over minutes, so compare
+    # scales the baseline by the ratio of the two runs' calibrations.
+    x = np.linspace(1, 2, 100_000)
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        y = x
+        for _ in range(10):
+            y = np.sqrt(y * y + 1.0)
+        sum(i * i for i in range(50_000))
+        times.append(time.perf_counter() - t)
+    return float(np.median(times))
+
+
+def build_tables():
+    # Cold build of every table, bypassing the persistent cache
+    enabled = injector.cache.ENABLED
+    injector.cache.ENABLED = False
+    try:
+        sat = injector.SaturationTable()
+        injector.IsentropicFlashTable()
+        injector.FluxMap(np.linspace(-20, sat.T_crit - 273.15 - 0.01, 400), np.linspace(1e5, 70e5, 300))
+    finally:
+        injector.cache.ENABLED = enabled
+
+
+def cases():
+    d = np.linspace(0.1, 2.5, 100) / 1000
+    d_nhne = np.linspace(0.1, 6, 1000) / 1000
+    temps = np.linspace(-10, 32, 500)
+
+    yield 'tables cold build', build_tables
+    yield 'HEM_CP 500 T', lambda: injector.HEM_CP(temps, 20e5)
+    yield 'HEM_CP 500 T exact', lambda: injector.HEM_CP(temps, 20e5, exact=True)
+    yield 'CalcSPI 100 d', lambda: injector.CalcSPI(20, 'NitrousOxide', 20e5, 12, d)
+    yield 'plotting 100 d', lambda: HEMCalcs.plotting(d, 20, 12)
+    yield 'density get_saturations', lambda: NitrousDensityPlots.get_saturations(NitrousDensityPlots.temperatures)
+    yield 'enthalpy get_saturations', lambda: NitrousEnthalpyPlots.get_saturations(NitrousEnthalpyPlots.temperatures)
+
+    def nhne_compute():
+        injector.mass_flow_grid(30, 20e5, d_nhne, 12, 0.6, 1.4)
+        injector.size_orifices(1.36, 30, 20e5, 12, 0.6, 1.4)
+    yield 'NHNEPlot compute', nhne_compute
+
+    for n in (100, 500, 2000):
+        T = np.linspace(-10, 32, n)
+        yield f'HEM sweep {n} T x 100 d', lambda T=T: injector.mass_flow_grid(T, 20e5, d, 12, models=('HEM',))
+        yield f'SPI sweep {n} T x 100 d', lambda T=T: injector.mass_flow_grid(T, 20e5, d, 12, models=('SPI',))
+
+    yield 'optimise_geometry 50 N x 56 d x 21 Cd', injector.optimise_geometry
+
+    def network():
+        net = injector.Network()
+        net.source('tank', T=np.linspace(-10, 30, 2000))
+        net.sink('chamber', P=20e5)
+        net.line('tank', 'manifold', d=8e-3, K=4)
+        net.orifices('manifold', 'chamber', N=12, d=1.5e-3)
+        net.orifices('manifold', 'chamber', N=6, d=1.0e-3, kappa='dyer')
+        net.solve()
+    yield 'network 2000 points', network
+
+    yield 'HEMmassflowrate', HEMCalcs.HEMmassflowrate
+    yield 'SPI_plot', SPICalcs.SPI_plot
+    yield 'NHNEPlot', lambda: NHNECalcs.NHNEPlot(30, 12, 1.4, 0.6, 1.36)
+    yield 'plot_curves', NitrousDensityPlots.plot_curves
+    yield 'plot_enthalpies', NitrousEnthalpyPlots.plot_enthalpies
+
+
+def run(selected=None, repeat=3):
+    warnings.simplefilter('ignore')
+    injector.flux_map()  # warm the tables so cases measure queries, not builds
+    before = calibrate()
+    results = {}
+    for name, func in cases():
+        if selected and not any(s in name for s in selected):
+            continue
+        results[name] = measure(func, repeat)
+        r = results[name]
+        print(f"{name:32s} {r['seconds'] * 1000:10.2f} ms {r['coolprop_calls']:7d} calls "
+              f"{r['coolprop_points']:9d} points {r['peak_bytes'] / 2**20:8.2f} MiB")
+    results[CALIBRATION] = {'seconds': 0.5 * (before + calibrate())}
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE, slack=SLACK):
+    # Names of cases slower than both tolerance times and slack seconds over their baseline,
+    # with the baseline scaled to this machine's current speed when both have a calibration
+    speed = 1.0
+    if CALIBRATION in results and CALIBRATION in baseline:
+        speed = results[CALIBRATION]['seconds'] / baseline[CALIBRATION]['seconds']
+        print(f'machine {speed:.2f}x the baseline time')
+    slower = []
+    for name, result in results.items():
+        if name in baseline and name != CALIBRATION:
+            base = baseline[name]['seconds'] * speed
+            ratio = result['seconds'] / base
+            print(f'{name:32s} {ratio:6.2f}x baseline')
+            if result['seconds'] > max(tolerance * base, base + slack):
+                slower.append(name)
+    return slower
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the property and flow-model hot paths')
+    parser.add_argument('cases', nargs='*', help='only run cases whose name contains one of these')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', metavar='JSON', help='write results, e.g. benchmarks/baseline.json')
+    parser.add_argument('--compare', metavar='JSON', nargs='?', const=BASELINE, help='compare against a results file')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='slowdown ratio reported as a regression')
+    parser.add_argument('--slack', type=float, default=SLACK * 1000,
+                        help='slowdown (ms) below which no case is reported as a regression')
+    args = parser.parse_args()
+
+    results = run(args.cases, args.repeat)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            slower = compare(results, json.load(f), args.tolerance, args.slack / 1000)
+        if slower:
+            sys.exit(f"slower than baseline: {', '.join(slower)}")
@@ -0,0 +1,53 @@
+import argparse
+import os
+import sys
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import injector
+
+# Physical trends simulate_blowdown must follow: the initial outflow falls and the burn
+# lengthens as the chamber pressure rises, and a tank that reaches the chamber pressure
+# before running dry ends with no flow. Exits 1 if any is broken.
+PC = np.array([10e5, 20e5, 30e5, 40e5])
+# Flow (kg/s) counted as stopped, and how close (Pa) the tank must have come to Pc
+FLOW_TOL = 1e-2
+PRESSURE_TOL = 1e3
+
+
+def check(V=0.03, m0=20, T0=20, N=12, d=1.5e-3, models=('SPI', 'NHNE', 'HEM')):
+    failures = []
+    for model in models:
+        result = injector.simulate_blowdown(V, m0, T0, N, d, Pc=PC, model=model)
+        last = np.array([np.flatnonzero(np.isfinite(result.mdot[:, k]))[-1] for k in range(len(PC))])
+        P_end = result.P[last, np.arange(len(PC))]
+        mdot_end = result.mdot[last, np.arange(len(PC))]
+        print(f'{model}')
+        print(f"  {'Pc (bar)':>9s} {'mdot0':>7s} {'burn (s)':>9s} {'P_end (bar)':>12s} {'mdot_end':>9s}")
+        for k, Pc in enumerate(PC):
+            print(f'  {Pc / 1e5:9.1f} {result.mdot[0, k]:7.3f} {result.burn_time[k]:9.2f} '
+                  f'{P_end[k] / 1e5:12.3f} {mdot_end[k]:9.5f}')
+
+        # HEM evaluated at the chamber pressure is not monotonic in Pc, so only SPI and NHNE
+        # are held to the trend. Burns cut short by reaching Pc are not compared.
+        reached = P_end - PC < PRESSURE_TOL
+        if model != 'HEM':
+            if np.any(np.diff(result.mdot[0]) >= 0):
+                failures.append(f'{model}: initial flow does not fall as Pc rises')
+            if np.any(np.diff(result.burn_time[~reached]) <= 0):
+                failures.append(f'{model}: burn time does not grow as Pc rises')
+        if np.any(mdot_end[reached] > FLOW_TOL):
+            failures.append(f'{model}: flow does not stop when the tank reaches Pc')
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the blowdown simulator against its physical trends')
+    parser.parse_args()
+    warnings.simplefilter('ignore', RuntimeWarning)
+    failures = check()
+    for failure in failures:
+        print(f'FAILED {failure}')
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Budget for `import injector` in a fresh interpreter, and modules it must not pull in
+IMPORT_BUDGET_S = 0.5
+FORBIDDEN = ('matplotlib', 'mpl_toolkits', 'ipywidgets', 'IPython', 'CoolProp')
+
+PROBE = f'''
+import sys, time
+t = time.perf_counter()
+import injector
+print(time.perf_counter() - t)
+print(','.join(name for name in {FORBIDDEN!r} if name in sys.modules))
+'''
+
+
+def import_time(repeat=5):
+    # Best of `repeat` fresh-interpreter import times (s), and any forbidden modules imported
+    times, loaded = [], ''
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', PROBE], cwd=REPO,
+                             capture_output=True, text=True, check=True).stdout.split('\n')
+        times.append(float(out[0]))
+        loaded = out[1]
+    return min(times), loaded
+
+
+if __name__ == '__main__':
+    seconds, loaded = import_time()
+    print(f'import injector: {seconds * 1000:.1f} ms (budget {IMPORT_BUDGET_S * 1000:.0f} ms)')
+    if loaded:
+        sys.exit(f'injector imported {loaded}')
+    if seconds > IMPORT_BUDGET_S:
+        sys.exit('import time over budget')
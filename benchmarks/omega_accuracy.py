@@ -0,0 +1,57 @@
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import injector
+
+# Bands of Pc / P_sat the error is reported over
+ETA_BANDS = ((0.0, 0.3), (0.3, 0.6), (0.6, 0.9), (0.9, 1.0))
+
+
+def envelope(n_T=60, n_Pc=60):
+    # Tank temperatures (C) from -20 C to 5 K below critical and chamber pressures (Pa) 5 to 60 bar
+    T_crit = injector.saturation_table().T_crit - 273.15
+    return np.linspace(-20, T_crit - 5, n_T)[:, None], np.linspace(5e5, 60e5, n_Pc)[None, :]
+
+
+def timed(func):
+    t = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - t
+
+
+def compare(n_T=60, n_Pc=60, exact=False):
+    # Relative error of the omega flux against the HEM flux over the envelope, by band of
+    # Pc / P_sat, plus both models' evaluation times. exact=True compares against CoolProp
+    # flashes instead of the tables.
+    T, Pc = (value.ravel() for value in np.broadcast_arrays(*envelope(n_T, n_Pc)))
+    injector.flux_map()  # warm the tables so the timings measure queries
+    (h1, h2, rho2), t_hem = timed(lambda: injector.HEM_CP(T, Pc, exact=exact))
+    G_omega, t_omega = timed(lambda: injector.omega_flux(T, Pc))
+    G_HEM = injector.mHEM(1, rho2, h1, h2, 1, 1)
+
+    error = np.abs(G_omega / G_HEM - 1)
+    eta = Pc / injector.saturation_table()('P', T + 273.15)
+    print(f'{T.size} points, HEM_CP{" exact" if exact else ""} {t_hem * 1000:.1f} ms, '
+          f'omega {t_omega * 1000:.1f} ms')
+    print(f"{'Pc / P_sat':>12s} {'points':>7s} {'median':>8s} {'p95':>8s} {'max':>8s}")
+    for lo, hi in ETA_BANDS:
+        band = error[(eta >= lo) & (eta < hi) & np.isfinite(error)]
+        if band.size:
+            print(f'{lo:5.1f}..{hi:<5.1f} {band.size:7d} {np.median(band):8.2%} '
+                  f'{np.percentile(band, 95):8.2%} {band.max():8.2%}')
+    return error
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Accuracy and speed of the omega method against HEM_CP')
+    parser.add_argument('--points', type=int, nargs=2, default=(60, 60), metavar=('N_T', 'N_PC'))
+    parser.add_argument('--exact', action='store_true', help='compare against CoolProp flashes instead of the tables')
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+    compare(*args.points, exact=args.exact)
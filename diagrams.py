@@ -1,31 +1,26 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import CoolProp.CoolProp as CP
 
+from injector import fluid_constant, isoline, saturation_table, stage
+
+@stage('VLE_diagram')
 def VLE_diagram():
 
     # Define the subst
     substance = 'NitrousOxide'
 
     # Define temperature range (in Kelvin)
-    T_min = CP.PropsSI(substance, 'Tmin') + 0.01  # slightly above the minimum temperature
-    T_max = CP.PropsSI(substance, 'Tcrit')        # critical temperature
+    T_min = fluid_constant(substance, 'Tmin') + 0.01  # slightly above the minimum temperature
+    T_max = fluid_constant(substance, 'Tcrit')        # critical temperature
     temperatures = np.linspace(T_min, T_max, int(2e3))
 
     def get_saturations(T):
-        liquid_density = []
-        vapor_density = []
-        saturation_pressures = []
-
-        # Calculate densities and pressures at each temperature
-        for T in temperatures:
-            ld = CP.PropsSI('D', 'T', T, 'Q', 0, substance)         # liquid density
-            vd = CP.PropsSI('D', 'T', T, 'Q', 1, substance)         # vapor density
-            psat = CP.PropsSI('P', 'T', T, 'Q', 0, substance) / 1e5 # saturation pressure
+        sat = saturation_table(substance)
 
-            liquid_density.append(ld)
-            vapor_density.append(vd)
-            saturation_pressures.append(psat)
+        # Look up densities and pressures at each temperature
+        liquid_density = sat('Dl', T)               # liquid density
+        vapor_density = sat('Dv', T)                # vapor density
+        saturation_pressures = sat('P', T) / 1e5    # saturation pressure
 
         return liquid_density, vapor_density, saturation_pressures
 
@@ -40,29 +35,19 @@ def VLE_diagram():
     plt.fill_between(temperatures, liquid_density, vapor_density, color='gray', alpha=0.2)
 
     # Add critical point
-    T_critical = CP.PropsSI('Tcrit', substance)
-    D_critical = CP.PropsSI('rhocrit', substance)
+    T_critical = fluid_constant(substance, 'Tcrit')
+    D_critical = fluid_constant(substance, 'rhocrit')
 
     plt.plot(T_critical, D_critical, 'kx', label='Critical Point')
 
-    # Plot isobar
+    # Plot isobar, with its saturation points at the crossing of the dome
     isoP = 50 * 1e5
-    isoP_Ts = np.linspace(260,370, 500)
-    rho = CP.PropsSI('D', 'P', isoP, 'T', isoP_Ts, substance)
-    plt.plot(isoP_Ts, rho, label=f'Isobar at {(isoP / 1e5):.1f} bar')
-    T_sat = CP.PropsSI('T', 'P', isoP, 'Q', 0, substance)
-
-    # Calculate the liquid saturation density at the isobar
-    rho_sat = CP.PropsSI('D', 'P', isoP, 'Q', 0, substance)
-
-    # Calculate the vapor saturation density at the isobar
-    rho_vap = CP.PropsSI('D', 'P', isoP, 'Q', 1, substance)
+    isobar = isoline('D', 'P', isoP, 'T', 260, 370, substance)
+    plt.plot(isobar.x, isobar.y, label=f'Isobar at {(isoP / 1e5):.1f} bar')
 
     # Plot saturation points
-    D_V = CP.PropsSI('D', 'P', isoP, 'Q', 1, substance)
-    D_L = CP.PropsSI('D', 'P', isoP, 'Q', 0, substance)
-    T_V = CP.PropsSI('T', 'P', isoP, 'Q', 1, substance)
-    T_L = CP.PropsSI('T', 'P', isoP, 'Q', 0, substance)
+    T_sat, D_L, D_V = isobar.saturation
+    T_V = T_L = T_sat
     plt.plot(T_V, D_V, 'ro', label=f'$\\rho_{{V, sat}}$ = {D_V:.2f} kg/m$^3$')
     plt.plot(T_L, D_L, 'bo', label=f'$\\rho_{{L, sat}}$ = {D_L:.2f} kg/m$^3$')
 
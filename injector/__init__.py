@@ -0,0 +1,18 @@
+# Headless core of the injector calculations: property tables and flow models only, with no
+# plotting or widget imports. CoolProp is imported on first use, and not at all when every
+# table needed is already in the property cache (or unless profiling is switched on). All
+# property evaluations go through injector.properties, which selects the CoolProp backend.
+from .properties import BACKENDS, STATUS, set_backend, get_backend, props, clear_failures, backend_report
+from .cache import cached, clear_cache, fluid_constant
+from .saturation import SaturationTable, saturation_table
+from .flash import IsentropicFlashTable, isentropic_table
+from .models import (A, mHEM, m_CPI, spi_flux, NHNE, dyer_kappa, resolve_kappa, HEM_CP, SPI_state, CalcSPI, fluxes, liquid_flux,
+                     hem_flux, omega_parameter, omega_critical_ratio, omega_flux, orifice_diameter, size_orifices, FlowGrid, mass_flow_grid, MODELS, AXES)
+from .fluxmaps import FluxMap, flux_map
+from .blowdown import BlowdownResult, simulate_blowdown, tank_temperature
+from .isolines import Isoline, isoline
+from .montecarlo import MonteCarloResult, halton, monte_carlo
+from .chamber import ChamberState, chamber_pressure
+from .optimiser import DRILL_SIZES, Geometry, optimise_geometry
+from .network import Network, NetworkSolution
+from .profiling import Profile, profile, stage
@@ -0,0 +1,199 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .models import MODELS, NHNE, A, dyer_kappa, fluxes, liquid_flux, orifice_diameter
+from .profiling import stage
+
+# Input columns and their defaults; T in C, Pc and the upstream pressure P1 in Pa (the vapour
+# pressure when empty), d in m and m_target in kg/s. kappa may be 'dyer', which needs P1.
+# Any other input columns (e.g. a case name) are passed through to the output.
+DEFAULTS = {'subst': 'NitrousOxide', 'T': None, 'Pc': None, 'P1': np.nan, 'N': 12, 'd': None, 'Cd': 0.66,
+            'kappa': 1.4, 'm_target': np.nan}
+RESULTS = ('kappa_used',) + tuple(f'm_{model}' for model in MODELS) + tuple(f'd_{model}' for model in MODELS)
+
+
+def read_cases(path):
+    # Cases from a CSV file, a JSON list of objects, or JSON lines (.jsonl), one dict per case.
+    # CSV and JSON lines are streamed; a .json list is parsed whole, so memory grows with it
+    # and large batches should use one of the others. '-' reads CSV from stdin.
+    if path == '-':
+        yield from csv.DictReader(sys.stdin)
+    elif path.endswith('.jsonl'):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif path.endswith('.json'):
+        with open(path) as f:
+            yield from json.load(f)
+    else:
+        with open(path, newline='') as f:
+            yield from csv.DictReader(f)
+
+
+def _column(cases, name, numbers):
+    # Values of input column name, with its default where empty; numbers are the cases' own
+    # numbers in the input, for error messages
+    values = []
+    for number, case in zip(numbers, cases):
+        value = case.get(name, '')
+        if value in ('', None):
+            if DEFAULTS[name] is None:
+                raise ValueError(f'case {number} has no {name}')
+            value = DEFAULTS[name]
+        values.append(value)
+    return values
+
+
+@stage('batch block')
+def evaluate(cases, first=1):
+    # HEM, SPI and NHNE mass flows (kg/s) at each case's diameter, and the diameters (m) that
+    # give its m_target, for a block of cases evaluated together. first is the number of the
+    # first case, for error messages. Returns the cases with every input column filled in with
+    # the value used and the RESULTS columns added.
+    results = [dict(case) for case in cases]
+    substs = _column(cases, 'subst', range(first, first + len(cases)))
+    for subst in set(substs):
+        rows = [i for i, name in enumerate(substs) if name == subst]
+        block = [cases[i] for i in rows]
+        numbers = [first + i for i in rows]
+        try:
+            inputs = {name: _column(block, name, numbers) for name in DEFAULTS}
+            T, Pc, P1, N, d, Cd, m_target = (np.array(inputs[name], dtype=float)
+                                             for name in ('T', 'Pc', 'P1', 'N', 'd', 'Cd', 'm_target'))
+            kappa = inputs['kappa']
+            dyer = np.array([value == 'dyer' for value in kappa])
+            kappa = np.array([np.nan if value == 'dyer' else value for value in kappa], dtype=float)
+        except ValueError as error:
+            raise ValueError(f'cases {first}-{first + len(cases) - 1}: {error}') from None
+        given = ~np.isnan(P1)
+        if np.any(dyer & ~given):
+            number = numbers[np.argmax(dyer & ~given)]
+            raise ValueError(f"case {number} has kappa 'dyer' but no P1, Dyer's kappa needs the upstream pressure")
+
+        with np.errstate(invalid='ignore'):
+            G_HEM, G_SPI = fluxes(T, Pc, subst)
+            if given.any():
+                G_SPI = np.where(given, liquid_flux(T, Pc, subst, P1), G_SPI)
+            kappa = np.where(dyer, dyer_kappa(T, Pc, P1, subst), kappa)
+            G = {'HEM': G_HEM, 'SPI': G_SPI, 'NHNE': NHNE(G_SPI, G_HEM, kappa)}
+            columns = {'kappa_used': kappa}
+            columns.update({f'm_{model}': N * Cd * A(d) * G[model] for model in MODELS})
+            columns.update({f'd_{model}': orifice_diameter(m_target, G[model], N, Cd) for model in MODELS})
+        for j, i in enumerate(rows):
+            results[i].update({name: inputs[name][j] for name in DEFAULTS})
+            results[i].update({name: float(columns[name][j]) for name in RESULTS})
+    return results
+
+
+class _CSVWriter:
+    # The header is every column of the first block: all inputs, the results and the first
+    # block's pass-through columns. A column first seen later has no place in it.
+    def __init__(self, f):
+        self.f = f
+        self.writer = None
+        self.written = 0
+
+    def write(self, rows):
+        if self.writer is None:
+            fieldnames = list(dict.fromkeys(name for row in rows for name in row))
+            self.writer = csv.DictWriter(self.f, fieldnames=fieldnames)
+            self.writer.writeheader()
+        for number, row in enumerate(rows, self.written + 1):
+            extra = [name for name in row if name not in self.writer.fieldnames]
+            if extra:
+                raise ValueError(f"case {number} has column {extra[0]!r}, which no case in the first block has; "
+                                 'give every case the same columns')
+        self.writer.writerows(rows)
+        self.written += len(rows)
+        self.f.flush()
+
+    def close(self):
+        self.f.flush()
+
+
+class _ParquetWriter:
+    # Needs pyarrow, which is optional; every block becomes a row group
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit('Parquet output needs pyarrow (pip install pyarrow), or write .csv instead') from None
+        self.pa, self.pq = pyarrow, pyarrow.parquet
+        self.path = path
+        self.writer = None
+
+    def write(self, rows):
+        table = self.pa.Table.from_pylist(rows)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def run_batch(cases, write, block_size=64, workers=None):
+    # Evaluate cases (any iterable of dicts) in blocks of block_size on a process pool, calling
+    # write(rows) with each block's results in input order as soon as it is ready. At most two
+    # blocks per worker are in flight, so memory does not grow with the number of cases.
+    # Returns the number of cases written.
+    workers = workers or os.cpu_count() or 1
+    cases = iter(cases)
+    pending = deque()
+    written = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        first = 1
+        while True:
+            while len(pending) < 2 * workers:
+                block = list(itertools.islice(cases, block_size))
+                if not block:
+                    break
+                pending.append(pool.submit(evaluate, block, first))
+                first += len(block)
+            if not pending:
+                return written
+            rows = pending.popleft().result()
+            write(rows)
+            written += len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m injector.batch',
+                                     description='Evaluate injector design cases headless, streaming the results')
+    parser.add_argument('cases', help="CSV, JSON or JSON-lines file of cases, or '-' for CSV on stdin; "
+                                      'a .json list is read whole, the others are streamed')
+    parser.add_argument('-o', '--output', default='-', help="results .csv or .parquet, or '-' for CSV on stdout")
+    parser.add_argument('--block-size', type=int, default=64, help='cases evaluated together per task')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    args = parser.parse_args(argv)
+
+    if args.output.endswith('.parquet'):
+        writer = _ParquetWriter(args.output)
+        f = None
+    else:
+        f = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+        writer = _CSVWriter(f)
+    try:
+        count = run_batch(read_cases(args.cases), writer.write, args.block_size, args.workers)
+    except ValueError as error:
+        raise SystemExit(f'error: {error}') from None
+    finally:
+        writer.close()
+        if f not in (None, sys.stdout):
+            f.close()
+    print(f'{count} cases written to {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
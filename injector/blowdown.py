@@ -0,0 +1,133 @@
+from collections import namedtuple
+
+import numpy as np
+
+from .models import A, NHNE, fluxes
+from .profiling import stage
+from .saturation import saturation_table
+
+BlowdownResult = namedtuple('BlowdownResult', 't T P m liquid_fraction mdot burn_time')
+
+
+def _internal_energies(sat, T):
+    # Saturated liquid and vapour internal energies u = h - P / rho
+    P = sat('P', T)
+    return sat('Hl', T) - P / sat('Dl', T), sat('Hv', T) - P / sat('Dv', T)
+
+
+def tank_temperature(v, u, subst='NitrousOxide', iterations=40):
+    # Temperature (K) of a saturated tank with specific volume v (m^3/kg) and specific internal
+    # energy u (J/kg). At fixed v, u rises monotonically with T across the dome, so this is
+    # a bisection on the saturation table, vectorized over the inputs.
+    sat = saturation_table(subst)
+    v, u = np.broadcast_arrays(np.asarray(v, dtype=float), np.asarray(u, dtype=float))
+    lo, hi = np.full(v.shape, sat.T_min), np.full(v.shape, sat.T_crit)
+    for _ in range(iterations):
+        T = 0.5 * (lo + hi)
+        v_l, v_v = 1 / sat('Dl', T), 1 / sat('Dv', T)
+        u_l, u_v = _internal_energies(sat, T)
+        too_hot = u_l + (v - v_l) / (v_v - v_l) * (u_v - u_l) > u
+        hi = np.where(too_hot, T, hi)
+        lo = np.where(too_hot, lo, T)
+    return 0.5 * (lo + hi)
+
+
+@stage('simulate_blowdown')
+def simulate_blowdown(V, m0, T0, N, d, Cd=0.66, Pc=20e5, model='NHNE', kappa=1.4, subst='NitrousOxide',
+                      rtol=1e-6, t_max=60.0, dt_out=0.01, dt_min=1e-6):
+    # Liquid-phase blowdown of a self-pressurising tank of volume V (m^3) initially holding
+    # m0 (kg) at T0 (C), draining saturated liquid through N orifices of diameter d into Pc (Pa).
+    # The tank stays in saturated equilibrium: the state is total mass and internal energy,
+    # and the liquid leaving carries h_l out, so the remaining liquid boils and cools the tank.
+    # Integration is adaptive Bogacki-Shampine RK3(2) on all inputs broadcast together, each
+    # case with its own step size, until the liquid runs out, the tank pressure falls to Pc
+    # (where the flow goes to zero) or t_max.
+    # Results are sampled every dt_out seconds, NaN after each case's burn_time.
+    if model not in ('HEM', 'SPI', 'NHNE'):
+        raise ValueError(f"unknown model {model!r}, expected 'HEM', 'SPI' or 'NHNE'")
+    if isinstance(kappa, str):
+        # Dyer's kappa needs an upstream pressure above the vapour pressure, this tank has none
+        raise ValueError(f"kappa={kappa!r} is not supported for a self-pressurised tank, give a number")
+    sat = saturation_table(subst)
+    V, m0, T0, N, d, Cd, Pc, kappa = np.broadcast_arrays(
+        *(np.asarray(value, dtype=float) for value in (V, m0, T0, N, d, Cd, Pc, kappa)))
+    shape = V.shape
+    V, m0, T0, N, d, Cd, Pc, kappa = (value.ravel() for value in (V, m0, T0, N, d, Cd, Pc, kappa))
+
+    T0 = T0 + 273.15
+    x0 = (V / m0 - 1 / sat('Dl', T0)) / (1 / sat('Dv', T0) - 1 / sat('Dl', T0))
+    if np.any((x0 < 0) | (x0 >= 1)):
+        raise ValueError('initial mass must leave both liquid and vapour in the tank at T0')
+    u_l, u_v = _internal_energies(sat, T0)
+    y = np.stack([m0, m0 * (u_l + x0 * (u_v - u_l))])
+
+    def state(y, cases):
+        m, U = y
+        T = tank_temperature(V[cases] / m, U / m, subst)
+        v_l, v_v = 1 / sat('Dl', T), 1 / sat('Dv', T)
+        quality = (V[cases] / m - v_l) / (v_v - v_l)
+        G_HEM, G_SPI = fluxes(T - 273.15, Pc[cases], subst)
+        G = {'HEM': G_HEM, 'SPI': G_SPI, 'NHNE': NHNE(G_SPI, G_HEM, kappa[cases])}[model]
+        mdot = N[cases] * Cd[cases] * A(d[cases]) * G
+        # No flow once the tank has fallen to the chamber pressure, whatever the model gives there
+        mdot = np.where(sat('P', T) > Pc[cases], mdot, 0.0)
+        return T, 1 - quality, mdot
+
+    def rhs(y, cases):
+        T, _, mdot = state(y, cases)
+        return np.stack([-mdot, -mdot * sat('Hl', T)])
+
+    n = len(V)
+    t = np.zeros(n)
+    h = np.full(n, 1e-3)
+    active = np.ones(n, dtype=bool)
+    history = [(t.copy(), y.copy())]
+    k1 = rhs(y, np.arange(n))
+    while active.any():
+        cases = np.flatnonzero(active)
+        hc, yc, k = h[cases], y[:, cases], k1[:, cases]
+        k2 = rhs(yc + 0.5 * hc * k, cases)
+        k3 = rhs(yc + 0.75 * hc * k2, cases)
+        y_new = yc + hc * (2 * k + 3 * k2 + 4 * k3) / 9
+        k4 = rhs(y_new, cases)
+        error = hc * np.abs(-5 * k / 72 + k2 / 12 + k3 / 9 - k4 / 8)
+        error = np.max(error / (rtol * np.abs(y_new) + 1e-12), axis=0)
+
+        _, liquid, mdot = state(y_new, cases)
+        ran_dry = ~(liquid > 0) | ~(mdot > 0) | np.isnan(error)
+        accept = (error <= 1) & ~ran_dry
+
+        t[cases[accept]] += hc[accept]
+        y[:, cases[accept]] = y_new[:, accept]
+        k1[:, cases[accept]] = k4[:, accept]
+        stepped = np.full(n, np.nan)
+        stepped[cases[accept]] = t[cases[accept]]
+        history.append((stepped, y.copy()))
+
+        # Grow accepted steps, shrink rejected ones, and halve towards the burnout event
+        factor = np.where(ran_dry, 0.5, np.clip(0.9 * np.where(error > 0, error, 1e-10) ** (-1 / 3), 0.2, 5))
+        h[cases] = np.minimum(hc * factor, t_max - t[cases])
+        active[cases[(ran_dry & (h[cases] < dt_min)) | (t[cases] >= t_max)]] = False
+
+    burn_time = t
+    t_hist = np.array([entry[0] for entry in history])
+    y_hist = np.array([entry[1] for entry in history])
+    t_out = np.arange(0, burn_time.max() + dt_out, dt_out)
+    m_out = np.full((len(t_out), n), np.nan)
+    U_out = np.full((len(t_out), n), np.nan)
+    for case in range(n):
+        steps = ~np.isnan(t_hist[:, case])
+        within = t_out <= burn_time[case]
+        m_out[within, case] = np.interp(t_out[within], t_hist[steps, case], y_hist[steps, 0, case])
+        U_out[within, case] = np.interp(t_out[within], t_hist[steps, case], y_hist[steps, 1, case])
+
+    T_out, liquid_out, mdot_out = (np.full_like(m_out, np.nan) for _ in range(3))
+    valid = ~np.isnan(m_out)
+    cases = np.broadcast_to(np.arange(n), m_out.shape)[valid]
+    T_out[valid], liquid_out[valid], mdot_out[valid] = state(np.stack([m_out[valid], U_out[valid]]), cases)
+
+    def shaped(value):
+        return value.reshape(len(t_out), *shape)
+
+    return BlowdownResult(t_out, shaped(T_out - 273.15), shaped(sat('P', T_out)), shaped(m_out),
+                          shaped(liquid_out), shaped(mdot_out), burn_time.reshape(shape))
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import shutil
+from importlib.metadata import version
+
+import numpy as np
+
+from .properties import constant
+
+# Generated property tables are kept as directories of .npy files, one per key, and loaded
+# memory-mapped. Set SUNFIRE_CACHE=0 to disable the cache.
+CACHE_DIR = os.environ.get('SUNFIRE_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'SunFireInjectors'))
+MAX_BYTES = int(os.environ.get('SUNFIRE_CACHE_MAX_BYTES', 512 * 2**20))
+ENABLED = os.environ.get('SUNFIRE_CACHE', '1') != '0'
+
+_constants = {}
+
+
+def cache_key(kind, **params):
+    # Entry name for a table of the given kind; params should name the substance, backend
+    # and input pair along with anything else the table depends on
+    params = dict(params, kind=kind, coolprop=version('CoolProp'))  # without importing CoolProp
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    return f'{kind}-{digest[:24]}'
+
+
+def array_digest(array):
+    # Short digest of an array, for keying tables built on a caller supplied grid
+    return hashlib.sha256(np.ascontiguousarray(array, dtype=float).tobytes()).hexdigest()[:24]
+
+
+def cached(kind, build, **params):
+    # Arrays returned by build() (a dict of name -> array), loaded from disk when an entry
+    # with the same key exists and stored there otherwise
+    if not ENABLED:
+        return build()
+
+    entry = os.path.join(CACHE_DIR, cache_key(kind, **params))
+    if os.path.isdir(entry):
+        try:
+            arrays = {name[:-4]: np.load(os.path.join(entry, name), mmap_mode='r')
+                      for name in os.listdir(entry) if name.endswith('.npy')}
+            os.utime(entry)  # most recently used entries are evicted last
+            return arrays
+        except (OSError, ValueError):
+            shutil.rmtree(entry, ignore_errors=True)
+
+    arrays = build()
+    _store(entry, arrays)
+    evict()
+    return arrays
+
+
+def _store(entry, arrays):
+    tmp = f'{entry}.tmp{os.getpid()}'
+    try:
+        os.makedirs(tmp, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, name + '.npy'), np.asarray(array))
+        os.replace(tmp, entry)
+    except OSError:
+        # Another process stored the same entry first, or the cache directory is read-only
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _entries():
+    if not os.path.isdir(CACHE_DIR):
+        return []
+    return [os.path.join(CACHE_DIR, name) for name in os.listdir(CACHE_DIR) if '.tmp' not in name]
+
+
+def _size(entry):
+    return sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+
+
+def evict(max_bytes=None):
+    # Remove least recently used entries until the cache is at most max_bytes
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    entries = sorted(_entries(), key=os.path.getmtime)
+    sizes = [_size(entry) for entry in entries]
+    total = sum(sizes)
+    for entry, size in zip(entries, sizes):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+
+
+def clear_cache():
+    for entry in _entries():
+        shutil.rmtree(entry, ignore_errors=True)
+
+
+def fluid_constant(subst, name):
+    # Trivial fluid constant such as 'Tmin', 'Tcrit', 'Pcrit' or 'rhocrit'
+    if subst not in _constants:
+        def build():
+            return {key: np.array(constant(subst, key)) for key in ('Tmin', 'Tcrit', 'Pcrit', 'rhocrit')}
+        _constants[subst] = {key: float(value) for key, value in
+                             cached('constants', build, subst=subst, backend='HEOS').items()}
+    return _constants[subst][name]
@@ -0,0 +1,61 @@
+from collections import namedtuple
+
+import numpy as np
+
+from .models import A, NHNE, fluxes, resolve_kappa
+from .profiling import stage
+from .saturation import saturation_table
+
+# Self-consistent chamber pressure (Pa), oxidiser mass flow and total propellant mass flow (kg/s)
+ChamberState = namedtuple('ChamberState', 'Pc m_ox m_total')
+
+
+@stage('chamber_pressure')
+def chamber_pressure(T, N, d, At, c_star, Cd=0.66, model='NHNE', kappa=1.4, m_fuel=0.0, OF=None,
+                     subst='NitrousOxide', P_min=1e5, n_scan=24, iterations=40):
+    # Chamber pressure where the nozzle passes what the injector delivers, Pc * At = c_star *
+    # (m_ox + m_fuel), for a tank of saturated liquid at T (C) feeding N orifices of diameter
+    # d (m) into a chamber with throat area At (m^2) and characteristic velocity c_star (m/s).
+    # Fuel is either a fixed m_fuel (kg/s) or set by the oxidiser/fuel ratio OF. The bracket
+    # [P_min, P_sat(T)] is scanned at n_scan pressures and the highest sign change bisected,
+    # since the unchoked HEM flux falls again at low Pc and gives spurious low roots.
+    # Vectorized over all inputs broadcast together; NaN where the balance has no root in the
+    # bracket (e.g. the fuel flow alone needs more than P_sat).
+    if model not in ('HEM', 'SPI', 'NHNE'):
+        raise ValueError(f"unknown model {model!r}, expected 'HEM', 'SPI' or 'NHNE'")
+    sat = saturation_table(subst)
+    T, N, d, At, c_star, Cd, m_fuel = np.broadcast_arrays(
+        *(np.asarray(value, dtype=float) for value in (T, N, d, At, c_star, Cd, m_fuel)))
+    area = N * Cd * A(d)
+
+    def oxidiser(Pc):
+        G_HEM, G_SPI = fluxes(T, Pc, subst)
+        if model == 'NHNE':
+            G = NHNE(G_SPI, G_HEM, resolve_kappa(kappa, T, Pc, subst))
+        else:
+            G = {'HEM': G_HEM, 'SPI': G_SPI}[model]
+        return area * G
+
+    def total(m_ox):
+        return m_ox * (1 + 1 / OF) if OF is not None else m_ox + m_fuel
+
+    def residual(Pc):
+        return c_star * total(oxidiser(Pc)) / At - Pc
+
+    P_sat = sat('P', T + 273.15) * (1 - 1e-9)
+    scan = P_min + (P_sat - P_min) * np.linspace(0, 1, n_scan).reshape((n_scan,) + (1,) * T.ndim)
+    positive = np.stack([residual(P) for P in scan]) > 0
+    falls = positive[:-1] & ~positive[1:]
+    bracketed = falls.any(axis=0)
+    last = n_scan - 2 - np.argmax(falls[::-1], axis=0)
+    lo = np.take_along_axis(scan, last[None], axis=0)[0]
+    hi = np.take_along_axis(scan, last[None] + 1, axis=0)[0]
+
+    for _ in range(iterations):
+        Pc = 0.5 * (lo + hi)
+        above = residual(Pc) > 0
+        lo, hi = np.where(above, Pc, lo), np.where(above, hi, Pc)
+
+    Pc = np.where(bracketed, 0.5 * (lo + hi), np.nan)
+    m_ox = np.where(bracketed, oxidiser(np.where(bracketed, Pc, P_min)), np.nan)
+    return ChamberState(Pc, m_ox, total(m_ox))
@@ -0,0 +1,123 @@
+import numpy as np
+
+from .saturation import saturation_table
+from .cache import cached
+from .properties import get_backend, props
+from .profiling import stage
+
+
+class IsentropicFlashTable:
+    # Surrogate for the (P, s) -> (h, rho) flash used by HEM_CP.
+    #
+    # Two-phase states use the lever rule at constant pressure, where h and 1/rho are exactly
+    # linear in s, on top of the saturation table, so their error is that of the saturation
+    # table. Subcooled liquid states (s below s_l(P)) are interpolated bilinearly on a grid of
+    # P and u = (s_l(P) - s) / (s_l(P) - s_floor), which is doubled in both directions until
+    # every cell centre is within rtol of HEOS. max_error holds the larger of the two bounds and
+    # check() measures the error against HEOS on random states. The liquid grid covers
+    # saturation temperatures from T_floor to T_ceil; states outside it, and superheated
+    # vapour, return NaN. Built grids are kept in the persistent property cache.
+    def __init__(self, subst='NitrousOxide', T_floor=233.15, T_ceil=None, rtol=1e-4, n_start=9, n_max=257):
+        self.subst = subst
+        self.sat = saturation_table(subst)
+        if T_ceil is None:
+            T_ceil = self.sat.T_crit - 5  # keep clear of the critical point
+        self.P_lo = self.sat('P', T_floor)
+        self.P_hi = self.sat('P', T_ceil)
+        self.s_floor = self.sat('Sl', T_floor)
+
+        table = cached('isentropic', lambda: self._build(rtol, n_start, n_max), subst=subst, backend=get_backend(),
+                       pair='P-S', T_floor=T_floor, T_ceil=T_ceil, rtol=rtol, n_start=n_start, n_max=n_max,
+                       saturation_rtol=self.sat.rtol)
+        self.P, self.u, self.h, self.rho = table['P'], table['u'], table['h'], table['rho']
+        self.max_error = max(float(table['max_error']), self.sat.max_error)
+
+    @stage('isentropic table build')
+    def _build(self, rtol, n_start, n_max):
+        n = n_start
+        while True:
+            self.P = np.linspace(self.P_lo, self.P_hi, n)
+            self.u = np.linspace(0, 1, n)
+            self.h, self.rho = self._liquid_flash(self.P[:, None], self.u[None, :])
+
+            Pm = 0.5 * (self.P[:-1] + self.P[1:])[:, None]
+            um = 0.5 * (self.u[:-1] + self.u[1:])[None, :]
+            h_exact, rho_exact = self._liquid_flash(Pm, um)
+            h_lin, rho_lin = self._liquid(Pm, um)
+            err = max(np.nanmax(np.abs(h_lin - h_exact)) / np.ptp(self.h),
+                      np.nanmax(np.abs(rho_lin / rho_exact - 1)))
+            if err <= rtol or 2 * n - 1 > n_max:
+                return dict(P=self.P, u=self.u, h=self.h, rho=self.rho, max_error=err)
+            n = 2 * n - 1
+
+    def _liquid_flash(self, P, u):
+        P, u = np.broadcast_arrays(P, u)
+        T_sat = self.sat.T_sat(P)
+        s_l = self.sat('Sl', T_sat)
+        s = s_l - u * (s_l - self.s_floor)
+        h, rho = props(('H', 'D'), 'P', P, 'S', s, self.subst)
+
+        # The saturated liquid edge comes from the saturation table to avoid flashing on the dome
+        on_dome = u == 0
+        h[on_dome] = self.sat('Hl', T_sat[on_dome])
+        rho[on_dome] = self.sat('Dl', T_sat[on_dome])
+        return h, rho
+
+    def _liquid(self, P, u):
+        # Bilinear interpolation of the subcooled grid
+        i = np.clip(np.searchsorted(self.P, P) - 1, 0, len(self.P) - 2)
+        j = np.clip(np.searchsorted(self.u, u) - 1, 0, len(self.u) - 2)
+        a = (P - self.P[i]) / (self.P[i + 1] - self.P[i])
+        b = (u - self.u[j]) / (self.u[j + 1] - self.u[j])
+
+        def bilinear(z):
+            return ((1 - a) * (1 - b) * z[i, j] + a * (1 - b) * z[i + 1, j]
+                    + (1 - a) * b * z[i, j + 1] + a * b * z[i + 1, j + 1])
+
+        return bilinear(self.h), bilinear(self.rho)
+
+    def __call__(self, P, s):
+        # Enthalpy (J/kg) and density (kg/m^3) at pressure(s) P (Pa) and entropy s (J/kg/K)
+        P, s = np.broadcast_arrays(np.asarray(P, dtype=float), np.asarray(s, dtype=float))
+        T_sat = self.sat.T_sat(P)
+        s_l, s_v = self.sat('Sl', T_sat), self.sat('Sv', T_sat)
+
+        # Two-phase: lever rule on the saturation table
+        x = (s - s_l) / (s_v - s_l)
+        h = self.sat('Hl', T_sat) + x * (self.sat('Hv', T_sat) - self.sat('Hl', T_sat))
+        v = 1 / self.sat('Dl', T_sat) + x * (1 / self.sat('Dv', T_sat) - 1 / self.sat('Dl', T_sat))
+        rho = 1 / v
+
+        # Subcooled liquid: bilinear grid
+        u = (s_l - s) / (s_l - self.s_floor)
+        h_liq, rho_liq = self._liquid(P, u)
+        liquid = x < 0
+        h = np.where(liquid, h_liq, h)
+        rho = np.where(liquid, rho_liq, rho)
+
+        outside = (x > 1) | np.isnan(x) | (liquid & ((P < self.P_lo) | (P > self.P_hi) | (u > 1)))
+        h = np.where(outside, np.nan, h)
+        rho = np.where(outside, np.nan, rho)
+        return h, rho
+
+    def check(self, n=2000, seed=0):
+        # Largest relative error in h (to the grid span) and rho against HEOS on n random states
+        rng = np.random.default_rng(seed)
+        P = rng.uniform(self.P_lo, self.P_hi, n)
+        s = rng.uniform(self.s_floor, self.sat('Sl', self.sat.T_sat(self.P_hi)), n)
+        h, rho = self(P, s)
+        h_exact, rho_exact = props(('H', 'D'), 'P', P, 'S', s, self.subst, 'HEOS')
+        valid = np.isfinite(h) & np.isfinite(h_exact)
+        return (np.max(np.abs(h - h_exact)[valid]) / np.ptp(self.h),
+                np.max(np.abs(rho / rho_exact - 1)[valid]))
+
+
+_tables = {}
+
+
+def isentropic_table(subst='NitrousOxide'):
+    # Shared table per substance and backend, built on first use
+    key = (subst, get_backend())
+    if key not in _tables:
+        _tables[key] = IsentropicFlashTable(subst)
+    return _tables[key]
@@ -0,0 +1,80 @@
+import numpy as np
+
+from .models import A, NHNE, fluxes, liquid_flux, resolve_kappa
+from .saturation import saturation_table
+from .cache import array_digest, cached
+from .profiling import stage
+from .properties import get_backend
+
+# Bumped whenever the stored fluxes change meaning, so maps cached by older code are rebuilt
+# rather than reused; 2 takes the SPI pressure drop as P_sat - Pc in Pa, 3 stores zero HEM
+# flux rather than NaN where Pc >= P_sat
+FORMAT_VERSION = 3
+
+
+class FluxMap:
+    # Mass flux through unit effective area (kg/m^2/s) of the HEM and SPI models on a grid of
+    # upstream temperature T (C) and chamber pressure Pc (Pa). Mass flow is the flux times
+    # N * Cd * A(d), so any injector geometry is a post-multiply of the cached map, and NHNE
+    # is the kappa blend of the two fluxes. Queries between grid points are bilinear, so
+    # accuracy near P_sat (where the HEM flux has a square-root edge) depends on the grid.
+    # Maps are kept in the persistent property cache.
+    def __init__(self, T, Pc, subst='NitrousOxide'):
+        self.subst = subst
+        self.T = np.asarray(T, dtype=float)
+        self.Pc = np.asarray(Pc, dtype=float)
+
+        @stage('flux map build')
+        def build():
+            G_HEM, G_SPI = fluxes(self.T[:, None], self.Pc[None, :], subst)
+            return {'HEM': G_HEM, 'SPI': G_SPI}
+        self.G = cached('flux', build, subst=subst, backend=get_backend(), pair='T-P', version=FORMAT_VERSION,
+                        T=array_digest(self.T), Pc=array_digest(self.Pc))
+
+    def flux(self, model, T, Pc, kappa=1.4, P1=None):
+        # Mass flux (kg/m^2/s) of 'HEM', 'SPI' or 'NHNE' at T (C) and Pc (Pa), broadcast
+        # together. The map holds SPI from the vapour pressure; given an upstream pressure P1
+        # (Pa), SPI is evaluated from it directly instead, which needs only the saturation table.
+        if model == 'NHNE':
+            return NHNE(self.flux('SPI', T, Pc, P1=P1), self.flux('HEM', T, Pc),
+                        resolve_kappa(kappa, T, Pc, self.subst, P1))
+        if model == 'SPI' and P1 is not None:
+            return liquid_flux(T, Pc, self.subst, P1)
+        return _bilinear(self.T, self.Pc, self.G[model], T, Pc)
+
+    def mass_flow(self, model, T, Pc, N, d, Cd=0.66, kappa=1.4, P1=None):
+        # Mass flow (kg/s) for N orifices of diameter d (m), all inputs broadcast together
+        return self.flux(model, T, Pc, kappa, P1) * N * Cd * A(d)
+
+
+def _bilinear(x, y, z, xi, yi):
+    # Bilinear interpolation of z(x, y) on a rectangular grid, NaN outside it
+    xi, yi = np.broadcast_arrays(np.asarray(xi, dtype=float), np.asarray(yi, dtype=float))
+    i = np.clip(np.searchsorted(x, xi) - 1, 0, max(len(x) - 2, 0))
+    j = np.clip(np.searchsorted(y, yi) - 1, 0, max(len(y) - 2, 0))
+    i1, j1 = np.minimum(i + 1, len(x) - 1), np.minimum(j + 1, len(y) - 1)
+    a = np.divide(xi - x[i], x[i1] - x[i], out=np.zeros(xi.shape), where=x[i1] != x[i])
+    b = np.divide(yi - y[j], y[j1] - y[j], out=np.zeros(yi.shape), where=y[j1] != y[j])
+
+    # Exact grid points keep their value even when a neighbouring cell corner is NaN
+    corners = [(z[i, j], (1 - a) * (1 - b)), (z[i1, j], a * (1 - b)), (z[i, j1], (1 - a) * b), (z[i1, j1], a * b)]
+    value = sum(np.where(weight == 0, 0, corner * weight) for corner, weight in corners)
+    outside = (xi < x[0]) | (xi > x[-1]) | (yi < y[0]) | (yi > y[-1])
+    return np.where(outside, np.nan, value)
+
+
+_maps = {}
+
+
+def flux_map(T=None, Pc=None, subst='NitrousOxide'):
+    # Shared map per substance, grid and backend, built on first use. The default grid spans
+    # -20 C to just below the critical temperature and 1 to 70 bar.
+    if T is None:
+        T = np.linspace(-20, saturation_table(subst).T_crit - 273.15 - 0.01, 400)
+    if Pc is None:
+        Pc = np.linspace(1e5, 70e5, 300)
+    T, Pc = np.asarray(T, dtype=float), np.asarray(Pc, dtype=float)
+    key = (subst, get_backend(), T.tobytes(), Pc.tobytes())
+    if key not in _maps:
+        _maps[key] = FluxMap(T, Pc, subst)
+    return _maps[key]
@@ -0,0 +1,111 @@
+import warnings
+from collections import namedtuple
+
+import numpy as np
+
+from .saturation import COLUMNS, saturation_table
+from .profiling import stage
+from .properties import OK, props
+
+# x and y of the curve (NaN where CoolProp failed, so plots break there), the saturation
+# crossing as (x_sat, y_liquid, y_vapour) or None, failed x ranges as (lo, hi) pairs, and
+# the status code of each sample (see properties.STATUS)
+Isoline = namedtuple('Isoline', 'x y saturation failed status')
+
+
+@stage('isoline')
+def isoline(output, fixed, value, free, lo, hi, subst='NitrousOxide', rtol=1e-3, n_start=17, n_max=2000):
+    # output along the line fixed = value, for free from lo to hi; fixed and free are 'P' and
+    # 'T' in either order. Where the line crosses the saturation curve it is split there and
+    # each branch ends on the tabulated saturated liquid or vapour state, so the jump across
+    # the dome is vertical at the exact crossing. Each branch is bisected until linear
+    # interpolation at every cell midpoint is within rtol of the branch's span, giving dense
+    # samples only near the dome and the critical point. Points CoolProp cannot evaluate are
+    # NaN and reported in failed (with a warning) instead of dropping the whole line.
+    codes = {}
+
+    def flash(x):
+        y, status = props(output, fixed, value, free, x, subst, status=True)
+        codes.update(zip(np.ravel(x).tolist(), status.ravel().tolist()))
+        return y
+
+    x_sat = _crossing(fixed, value, subst)
+    if not lo < x_sat < hi:
+        x, y = _refine(flash, lo, hi, rtol, n_start, n_max)
+        saturation = None
+    else:
+        y_l, y_v = _saturated(output, fixed, value, subst)
+        # Isobars are liquid below T_sat, isotherms are liquid above P_sat
+        y_lo, y_hi = (y_l, y_v) if free == 'T' else (y_v, y_l)
+        x_a, y_a = _refine(flash, lo, x_sat, rtol, n_start, n_max // 2, y_end=y_lo)
+        x_b, y_b = _refine(flash, x_sat, hi, rtol, n_start, n_max // 2, y_start=y_hi)
+        x, y = np.concatenate([x_a, x_b]), np.concatenate([y_a, y_b])
+        saturation = (x_sat, y_l, y_v)
+
+    failed = _failed_ranges(x, y)
+    if failed:
+        ranges = ', '.join(f'{a:.6g}..{b:.6g}' for a, b in failed)
+        warnings.warn(f'CoolProp failed for {output} at {fixed}={value:.6g}, {free} in {ranges}')
+    # Ends on the saturation curve come from the table
+    status = np.array([codes.get(point, OK) for point in x.tolist()], dtype=np.int8)
+    return Isoline(x, y, saturation, failed, status)
+
+
+def _crossing(fixed, value, subst):
+    # Free-variable value where the line meets the saturation curve, NaN above the critical point
+    sat = saturation_table(subst)
+    return float(sat.T_sat(value)) if fixed == 'P' else float(sat('P', value))
+
+
+def _saturated(output, fixed, value, subst):
+    # Saturated liquid and vapour output at the crossing, from the table when it holds output
+    sat = saturation_table(subst)
+    T = float(sat.T_sat(value)) if fixed == 'P' else value
+    if output + 'l' in COLUMNS:
+        return float(sat(output + 'l', T)), float(sat(output + 'v', T))
+    return tuple(float(props(output, 'T', T, 'Q', Q, subst)) for Q in (0, 1))
+
+
+def _refine(flash, lo, hi, rtol, n_start, n_max, y_start=None, y_end=None):
+    # Bisect [lo, hi] where the midpoint is off the chord by more than rtol of the span. Given
+    # end values replace evaluating the (saturated) end points, which P-T inputs cannot do.
+    x = np.linspace(lo, hi, n_start)
+    inner = slice(1 if y_start is not None else 0, -1 if y_end is not None else None)
+    y = np.full(n_start, np.nan)
+    y[inner] = flash(x[inner])
+    if y_start is not None:
+        y[0] = y_start
+    if y_end is not None:
+        y[-1] = y_end
+
+    dx_min = (hi - lo) * 1e-6
+    a, b = np.arange(n_start - 1), np.arange(1, n_start)
+    cells = np.stack([x[a], x[b], y[a], y[b]])
+    while cells.shape[1] and len(x) + cells.shape[1] <= n_max:
+        x_lo, x_hi, y_lo, y_hi = cells
+        xm = 0.5 * (x_lo + x_hi)
+        ym = flash(xm)
+        x, y = np.concatenate([x, xm]), np.concatenate([y, ym])
+
+        span = np.nanmax(y) - np.nanmin(y) if np.isfinite(y).any() else 1.0
+        error = np.abs(ym - 0.5 * (y_lo + y_hi))
+        # Cells with a failed end are split too, which narrows down the failed range
+        split = ((error > rtol * span) | (np.isnan(ym) != np.isnan(y_lo)) | (np.isnan(ym) != np.isnan(y_hi)))
+        split &= ~(np.isnan(y_lo) & np.isnan(y_hi)) & (x_hi - x_lo > 2 * dx_min)
+        cells = np.concatenate([np.stack([x_lo, xm, y_lo, ym])[:, split],
+                                np.stack([xm, x_hi, ym, y_hi])[:, split]], axis=1)
+
+    order = np.argsort(x, kind='stable')
+    return x[order], y[order]
+
+
+def _failed_ranges(x, y):
+    # (lo, hi) for each run of NaN samples, bounded by the good samples either side
+    failed = np.isnan(y)
+    if not failed.any():
+        return []
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], failed.astype(int), [0]])))
+    ranges = []
+    for start, stop in zip(edges[::2], edges[1::2]):
+        ranges.append((float(x[max(start - 1, 0)]), float(x[min(stop, len(x) - 1)])))
+    return ranges
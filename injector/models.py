@@ -0,0 +1,249 @@
+import numpy as np
+
+from .saturation import saturation_table
+from .flash import isentropic_table
+from .profiling import stage
+from .properties import props
+
+MODELS = ('HEM', 'SPI', 'NHNE')
+# Order of the named axes in a FlowGrid, inputs given as scalars are dropped
+AXES = ('model', 'T', 'Pc', 'd', 'N', 'Cd', 'kappa')
+
+
+def A(d):
+    return np.pi * (d / 2) ** 2
+
+
+def mHEM(A, rho2, h1, h2, N, Cd=0.66):
+    # Zero rather than NaN where the isentropic expansion gains enthalpy (no pressure drop)
+    return N * A * Cd * rho2 * np.sqrt(np.maximum(2*(h1 - h2), 0))
+
+
+def m_CPI(A, rho0, P1, P2, N, Cd=0.66):
+    return A * Cd * N * np.sqrt(2 * rho0 * (P2 - P1))
+
+
+def spi_flux(rho, P1, P2):
+    # SPI mass flux (kg/m^2/s) of liquid of density rho (kg/m^3) from P1 to P2, both in Pa.
+    # Zero rather than NaN where P2 >= P1, so there is no flow once the drop vanishes.
+    return np.sqrt(2 * rho * np.maximum(np.subtract(P1, P2), 0))
+
+
+def NHNE(m_SPI, m_HEM, kap):
+    # Dyer's non-homogeneous non-equilibrium blend of the SPI and HEM mass flows
+    if np.any(np.isinf(kap)):
+        # kappa -> inf where the liquid cannot flash in the orifice, leaving pure SPI
+        with np.errstate(invalid='ignore'):
+            return np.where(np.isinf(kap), m_SPI, ((kap / (1 + kap)) * m_SPI) + (1/(1 + kap) * m_HEM))
+    return ((kap / (1 + kap)) * m_SPI) + (1/(1 + kap) * m_HEM)
+
+
+def dyer_kappa(T, Pc, P1, subst='NitrousOxide'):
+    # Dyer's kappa = sqrt((P1 - Pc) / (Pv - Pc)), the ratio of bubble growth time to liquid
+    # residence time in the orifice, for liquid at T (C) and upstream pressure P1 (Pa)
+    # discharging into Pc (Pa), with Pv the vapour pressure at T from the saturation table.
+    # A self-pressurised tank has P1 = Pv and kappa = 1; a supercharged tank has P1 > Pv and
+    # leans towards SPI. Infinite where Pv <= Pc, NaN where P1 <= Pc (no flow).
+    Pv = saturation_table(subst)('P', np.asarray(T, dtype=float) + 273.15)
+    P1 = np.asarray(P1, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kappa = np.sqrt((P1 - Pc) / (Pv - Pc))
+    return np.where(Pv > Pc, kappa, np.where(P1 > Pc, np.inf, np.nan))
+
+
+def resolve_kappa(kappa, T, Pc, subst='NitrousOxide', P1=None):
+    # kappa='dyer' computes Dyer's kappa per operating point from the upstream pressure P1
+    # (Pa), which it needs: without one the tank is self-pressurised and kappa is always 1
+    if isinstance(kappa, str):
+        if kappa != 'dyer':
+            raise ValueError(f"unknown kappa {kappa!r}, expected a number or 'dyer'")
+        if P1 is None:
+            raise ValueError("kappa='dyer' needs the upstream pressure P1, without it (a self-pressurised "
+                             "tank, P1 = P_sat) Dyer's kappa is 1")
+        return dyer_kappa(T, Pc, P1, subst)
+    return kappa
+
+
+@stage('HEM_CP')
+def HEM_CP(T1, P2, subst='NitrousOxide', exact=False):
+    # exact=True flashes every point with the property backend instead of using the
+    # saturation and isentropic tables (see IsentropicFlash for their error bound)
+    if exact:
+        h1, s1 = props(('H', 'S'), 'T', np.asarray(T1) + 273.15, 'Q', 0, subst)
+
+        # Find downstream enthalpy and density with upstream entropy and downstream pressure
+        h2, rho2 = props(('H', 'D'), 'P', P2, 'S', s1, subst)
+        return h1, h2, rho2
+
+    sat = saturation_table(subst)
+    h1 = sat('Hl', T1 + 273.15)
+    s1 = sat('Sl', T1 + 273.15)
+
+    # Downstream enthalpy and density at upstream entropy and downstream pressure
+    h2, rho2 = isentropic_table(subst)(P2, s1)
+    return h1, h2, rho2
+
+
+@stage('SPI_state')
+def SPI_state(T, subst='NitrousOxide'):
+    # Saturation pressure (bar) and liquid density at upstream temperature T (C), as used by CalcSPI
+    sat = saturation_table(subst)
+    return sat('P', T + 273.15) / 1e5, sat('Dl', T + 273.15)
+
+
+def CalcSPI(T, substance, P_chamber, N, d, Cd=0.66):
+    # SPI mass flow (kg/s) into P_chamber (Pa), with P_sat returned in bar as the notebook shows it
+    P_sat, D_sat = SPI_state(T, substance)
+    return N * Cd * A(d) * spi_flux(D_sat, P_sat * 1e5, P_chamber), P_sat, D_sat
+
+
+def fluxes(T, Pc, subst='NitrousOxide', P1=None):
+    # HEM and SPI mass flux (kg/m^2/s) of liquid at T (C) into Pc (Pa), through unit effective
+    # area N * Cd * A(d). P1 is the upstream pressure (Pa) driving SPI, the vapour pressure
+    # at T by default (a self-pressurised tank); HEM always expands saturated liquid at T.
+    return hem_flux(T, Pc, subst), liquid_flux(T, Pc, subst, P1)
+
+
+def hem_flux(T, Pc, subst='NitrousOxide'):
+    # HEM mass flux (kg/m^2/s) of saturated liquid at T (C) into Pc (Pa), zero where Pc is at
+    # or above the vapour pressure, like spi_flux, even where the flash table has no state
+    h1, h2, rho2 = HEM_CP(T, Pc, subst)
+    P_sat = saturation_table(subst)('P', np.asarray(T, dtype=float) + 273.15)
+    return np.where(Pc >= P_sat, 0.0, mHEM(1, rho2, h1, h2, 1, 1))[()]
+
+
+def liquid_flux(T, Pc, subst='NitrousOxide', P1=None):
+    # SPI mass flux (kg/m^2/s) of liquid at T (C) from P1 (Pa, the vapour pressure by default)
+    # into Pc (Pa)
+    sat = saturation_table(subst)
+    T = np.asarray(T, dtype=float) + 273.15
+    return spi_flux(sat('Dl', T), sat('P', T) if P1 is None else P1, Pc)
+
+
+def omega_parameter(T, subst='NitrousOxide'):
+    # Leung's omega for saturated liquid at T (C), from one isentropic expansion to 0.9 P_sat:
+    # omega = 9 (v9 / v0 - 1), the two-point fit of v / v0 = omega (P0 / P - 1) + 1
+    sat = saturation_table(subst)
+    T0 = T + 273.15
+    _, rho9 = isentropic_table(subst)(0.9 * sat('P', T0), sat('Sl', T0))
+    return 9 * (sat('Dl', T0) / rho9 - 1)
+
+
+def omega_critical_ratio(omega, iterations=50):
+    # Critical pressure ratio eta_c of the omega model, the root in (0, 1) of
+    # eta^2 + (omega^2 - 2 omega)(1 - eta)^2 + 2 omega^2 ln(eta) + 2 omega^2 (1 - eta) = 0
+    omega = np.asarray(omega, dtype=float)
+    lo, hi = np.full(omega.shape, 1e-6), np.full(omega.shape, 1.0)
+    for _ in range(iterations):
+        eta = 0.5 * (lo + hi)
+        f = eta**2 + (omega**2 - 2*omega) * (1 - eta)**2 + 2 * omega**2 * np.log(eta) + 2 * omega**2 * (1 - eta)
+        lo, hi = np.where(f < 0, eta, lo), np.where(f < 0, hi, eta)
+    return 0.5 * (lo + hi)
+
+
+@stage('omega_flux')
+def omega_flux(T, Pc, subst='NitrousOxide', choked=False):
+    # Closed-form two-phase mass flux (kg/m^2/s) of saturated liquid at T (C) expanding to
+    # Pc (Pa), from Leung's omega method: omega comes from the tables once per inlet state and
+    # the rest is NumPy. choked=False evaluates at Pc like HEM_CP does; choked=True limits
+    # the flux to its critical value where Pc is below eta_c * P_sat. Zero where P_sat <= Pc.
+    sat = saturation_table(subst)
+    P0, rho0 = sat('P', T + 273.15), sat('Dl', T + 273.15)
+    omega = omega_parameter(T, subst)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        eta = np.minimum(Pc / P0, 1)
+        if choked:
+            eta_c = omega_critical_ratio(omega)
+            eta = np.where(eta < eta_c, eta_c, eta)
+        work = -2 * (omega * np.log(eta) + (omega - 1) * (1 - eta))
+        G = np.sqrt(np.maximum(work, 0)) / (omega * (1 / eta - 1) + 1)
+    return G * np.sqrt(P0 * rho0)
+
+
+def orifice_diameter(m, G, N, Cd=0.66):
+    # Diameter (m) of N orifices passing mass flow m at mass flux G, from m = N * Cd * A(d) * G;
+    # NaN where G is zero, as no orifice passes any flow
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(G > 0, 2 * np.sqrt(m / (np.pi * N * Cd * G)), np.nan)[()]
+
+
+def size_orifices(m, T, Pc, N, Cd=0.66, kappa=1.4, subst='NitrousOxide', P1=None):
+    # Design diameters (d_HEM, d_SPI, d_NHNE) in m for target mass flow m (kg/s) at upstream
+    # temperature T (C), chamber pressure Pc (Pa) and upstream pressure P1 (Pa, see fluxes),
+    # all inputs broadcast together. Mass flow is linear in A(d) for every model, so the
+    # inversion is exact.
+    G_HEM, G_SPI = fluxes(T, Pc, subst, P1)
+    G_NHNE = NHNE(G_SPI, G_HEM, resolve_kappa(kappa, T, Pc, subst, P1))
+    return tuple(orifice_diameter(m, G, N, Cd) for G in (G_HEM, G_SPI, G_NHNE))
+
+
+class FlowGrid:
+    # Mass flows with one named axis per swept input, see mass_flow_grid
+    def __init__(self, values, dims, coords):
+        self.values = values
+        self.dims = tuple(dims)
+        self.coords = coords
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def __array__(self, dtype=None, copy=None):
+        return self.values if dtype is None else self.values.astype(dtype)
+
+    def __getitem__(self, model):
+        return self.sel(model=model)
+
+    def sel(self, **coords):
+        # Select the nearest coordinate along each named axis, dropping that axis
+        values, dims = self.values, list(self.dims)
+        new_coords = dict(self.coords)
+        for name, value in coords.items():
+            axis = dims.index(name)
+            if name == 'model':
+                index = list(self.coords['model']).index(value)
+            else:
+                index = np.argmin(np.abs(np.asarray(self.coords[name]) - value))
+            values = np.take(values, index, axis=axis)
+            dims.pop(axis)
+            new_coords.pop(name)
+        return FlowGrid(values, dims, new_coords)
+
+
+@stage('mass_flow_grid')
+def mass_flow_grid(T, Pc, d, N=12, Cd=0.66, kappa=1.4, subst='NitrousOxide', models=MODELS, P1=None):
+    # Mass flow (kg/s) for every combination of the inputs in one batched evaluation.
+    # T is the upstream temperature (C), Pc the downstream/chamber pressure (Pa) and d the
+    # orifice diameter (m). Each 1-D input becomes its own axis, in the order of AXES,
+    # and scalar inputs are broadcast without adding an axis. P1 is the upstream pressure
+    # (Pa, see fluxes), not an axis: a scalar or an array broadcasting against the grid.
+    # kappa='dyer' takes Dyer's kappa from P1 at each point instead of a fixed value.
+    # models may also name 'OMEGA', the closed-form omega-method approximation of HEM.
+    inputs = dict(T=T, Pc=Pc, d=d, N=N, Cd=Cd, kappa=np.nan if isinstance(kappa, str) else kappa)
+    swept = [name for name in AXES[1:] if np.ndim(inputs[name]) == 1]
+    shaped = {}
+    for name, value in inputs.items():
+        value = np.asarray(value, dtype=float)
+        if value.ndim == 1:
+            shape = [1] * len(swept)
+            shape[swept.index(name)] = len(value)
+            value = value.reshape(shape)
+        shaped[name] = value
+
+    T, Pc, d, N, Cd = (shaped[name] for name in AXES[1:-1])
+    kappa = kappa if isinstance(kappa, str) else shaped['kappa']
+    flows = {}
+    if 'HEM' in models or 'NHNE' in models:
+        flows['HEM'] = N * Cd * A(d) * hem_flux(T, Pc, subst)
+    if 'SPI' in models or 'NHNE' in models:
+        flows['SPI'] = N * Cd * A(d) * liquid_flux(T, Pc, subst, P1)
+    if 'OMEGA' in models:
+        flows['OMEGA'] = N * Cd * A(d) * omega_flux(T, Pc, subst)
+    if 'NHNE' in models:
+        flows['NHNE'] = NHNE(flows['SPI'], flows['HEM'], resolve_kappa(kappa, T, Pc, subst, P1))
+
+    shape = np.broadcast_shapes(*(value.shape for value in shaped.values()))
+    values = np.stack([np.broadcast_to(flows[model], shape) for model in models])
+    coords = {name: np.asarray(inputs[name]) for name in swept}
+    coords['model'] = tuple(models)
+    return FlowGrid(values, ('model', *swept), coords)
@@ -0,0 +1,177 @@
+from collections import namedtuple
+
+import numpy as np
+
+from .fluxmaps import flux_map
+from .models import A, MODELS, NHNE, resolve_kappa
+from .profiling import stage
+
+# Uncertain inputs, in the order they take Halton dimensions
+INPUTS = ('T', 'Pc', 'd', 'N', 'Cd', 'kappa', 'P1')
+# Smallest bases first, the low Halton dimensions are the best distributed
+PRIMES = (2, 3, 5, 7, 11, 13, 17)
+
+# Summary of one model's mass flow (kg/s) over n valid samples: percentiles is {q: value},
+# sensitivity is the first-order index {input: S} of each uncertain input, and failed counts
+# samples outside the flux map or with no flow (left out of everything else)
+MonteCarloResult = namedtuple('MonteCarloResult', 'n mean std percentiles sensitivity failed')
+
+
+def _norm_ppf(u):
+    # Inverse standard normal CDF (Acklam's rational approximation, relative error < 1.2e-9)
+    a = (-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+         1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00)
+    b = (-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+         6.680131188771972e+01, -1.328068155288572e+01)
+    c = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+         -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00)
+    d = (7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00, 3.754408661907416e+00)
+
+    def tail(q):
+        return (((((c[0] * q + c[1]) * q + c[2]) * q + c[3]) * q + c[4]) * q + c[5]) / \
+               ((((d[0] * q + d[1]) * q + d[2]) * q + d[3]) * q + 1)
+
+    u = np.asarray(u, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        q = u - 0.5
+        r = q * q
+        central = (((((a[0] * r + a[1]) * r + a[2]) * r + a[3]) * r + a[4]) * r + a[5]) * q / \
+                  (((((b[0] * r + b[1]) * r + b[2]) * r + b[3]) * r + b[4]) * r + 1)
+        low = tail(np.sqrt(-2 * np.log(u)))
+        high = -tail(np.sqrt(-2 * np.log(1 - u)))
+    return np.where(u < 0.02425, low, np.where(u > 1 - 0.02425, high, central))
+
+
+def _triangular_ppf(u, lo, mode, hi):
+    split = (mode - lo) / (hi - lo)
+    return np.where(u < split, lo + np.sqrt(u * (hi - lo) * (mode - lo)),
+                    hi - np.sqrt((1 - u) * (hi - lo) * (hi - mode)))
+
+
+# Inverse CDFs of the supported distributions, mapping uniform u in (0, 1) to samples
+DISTRIBUTIONS = {
+    'normal': lambda u, mean, sd: mean + sd * _norm_ppf(u),
+    'uniform': lambda u, lo, hi: lo + (hi - lo) * u,
+    'triangular': _triangular_ppf,
+}
+
+
+def halton(start, n, dims, shift=None):
+    # Points start..start+n-1 of the Halton sequence in dims dimensions, shape (n, dims). A
+    # shift in [0, 1)^dims gives the randomised (Cranley-Patterson rotated) sequence.
+    index = np.arange(start + 1, start + n + 1)
+    u = np.empty((n, dims))
+    for dim, base in enumerate(PRIMES[:dims]):
+        i = index.copy()
+        value, scale = np.zeros(n), 1.0
+        while i.any():
+            scale /= base
+            value += scale * (i % base)
+            i //= base
+        u[:, dim] = value
+    if shift is not None:
+        u = (u + shift) % 1
+    return u
+
+
+class _Histogram:
+    # Streaming percentiles of an unbounded sample: fine bins over the range of the first
+    # batch (padded by half its span), with exact extremes tracking anything outside them
+    def __init__(self, bins):
+        self.bins = bins
+        self.edges = None
+
+    def add(self, values):
+        if self.edges is None:
+            lo, hi = values.min(), values.max()
+            pad = 0.5 * (hi - lo) or 1e-9 * max(abs(lo), 1)
+            self.edges = np.linspace(lo - pad, hi + pad, self.bins + 1)
+            self.counts = np.zeros(self.bins + 2)  # under and overflow at either end
+            self.min, self.max = lo, hi
+        self.counts += np.bincount(np.searchsorted(self.edges, values, side='right'), minlength=self.bins + 2)
+        self.min, self.max = min(self.min, values.min()), max(self.max, values.max())
+
+    def percentile(self, q):
+        # Linear within bins; the under and overflow bins span the exact extremes
+        edges = np.concatenate([[min(self.min, self.edges[0])], self.edges, [max(self.max, self.edges[-1])]])
+        cumulative = np.concatenate([[0], np.cumsum(self.counts)])
+        return float(np.interp(q / 100 * cumulative[-1], cumulative, edges))
+
+
+@stage('monte_carlo')
+def monte_carlo(n, T, Pc, d, N=12, Cd=0.66, kappa=1.4, models=MODELS, method='halton', seed=0,
+                chunk_size=100_000, percentiles=(1, 5, 50, 95, 99), bins=64, subst='NitrousOxide', fluxes=None,
+                P1=None):
+    # Mass flow distribution of each model over n samples of the inputs, each either a fixed
+    # value or a distribution ('normal', mean, sd), ('uniform', lo, hi) or ('triangular', lo,
+    # mode, hi), with T in C, Pc and the upstream pressure P1 (None for the vapour pressure,
+    # see fluxes) in Pa and d in m; kappa may also be 'dyer', which needs P1. method 'halton'
+    # uses the randomised Halton sequence (shifted by seed), 'random' independent samples.
+    # SPI from a given P1 is evaluated directly, the rest of the fluxes are interpolated from
+    # the flux map (flux_map() unless given), and samples are drawn and reduced chunk_size at
+    # a time, so memory does not grow with n. Percentiles come from a streaming histogram and
+    # sensitivity indices are correlation ratios Var(E[m | input]) / Var(m) over `bins`
+    # equal-probability bins of each uncertain input. Returns {model: MonteCarloResult}.
+    spec = dict(T=T, Pc=Pc, d=d, N=N, Cd=Cd, kappa=kappa, P1=P1)
+    uncertain = [name for name in INPUTS if isinstance(spec[name], tuple)]
+    fluxes = flux_map(subst=subst) if fluxes is None else fluxes
+    rng = np.random.default_rng(seed)
+    shift = rng.random(len(uncertain))
+
+    stats = {model: {'n': 0, 'sum': 0.0, 'sum2': 0.0, 'failed': 0, 'histogram': _Histogram(4096),
+                     'bin_n': np.zeros((len(uncertain), bins)), 'bin_sum': np.zeros((len(uncertain), bins))}
+             for model in models}
+
+    for start in range(0, n, chunk_size):
+        size = min(chunk_size, n - start)
+        if method == 'halton':
+            u = halton(start, size, len(uncertain), shift)
+        elif method == 'random':
+            u = rng.random((size, len(uncertain)))
+        else:
+            raise ValueError(f"unknown method {method!r}, expected 'halton' or 'random'")
+
+        values = dict(spec)
+        for column, name in enumerate(uncertain):
+            kind, *params = spec[name]
+            values[name] = DISTRIBUTIONS[kind](u[:, column], *params)
+        which_bin = np.minimum((u * bins).astype(int), bins - 1)
+
+        G = {'HEM': fluxes.flux('HEM', values['T'], values['Pc']),
+             'SPI': fluxes.flux('SPI', values['T'], values['Pc'], P1=values['P1'])}
+        G['NHNE'] = NHNE(G['SPI'], G['HEM'], resolve_kappa(values['kappa'], values['T'], values['Pc'], subst,
+                                                            values['P1']))
+        area = values['N'] * values['Cd'] * A(values['d'])
+        for model in models:
+            m = np.broadcast_to(G[model] * area, (size,))
+            valid = np.isfinite(m) & (m > 0)
+            s, m = stats[model], m[valid]
+            s['n'] += m.size
+            s['failed'] += size - m.size
+            if not m.size:
+                continue
+            s['sum'] += m.sum()
+            s['sum2'] += (m * m).sum()
+            s['histogram'].add(m)
+            for column in range(len(uncertain)):
+                s['bin_n'][column] += np.bincount(which_bin[valid, column], minlength=bins)
+                s['bin_sum'][column] += np.bincount(which_bin[valid, column], weights=m, minlength=bins)
+
+    results = {}
+    for model, s in stats.items():
+        if not s['n']:
+            results[model] = MonteCarloResult(0, np.nan, np.nan, {q: np.nan for q in percentiles},
+                                              {name: np.nan for name in uncertain}, s['failed'])
+            continue
+        mean = s['sum'] / s['n']
+        variance = max(s['sum2'] / s['n'] - mean ** 2, 0.0)
+        sensitivity = {}
+        for column, name in enumerate(uncertain):
+            filled = s['bin_n'][column] > 0
+            bin_mean = s['bin_sum'][column][filled] / s['bin_n'][column][filled]
+            between = np.sum(s['bin_n'][column][filled] * (bin_mean - mean) ** 2) / s['n']
+            sensitivity[name] = float(between / variance) if variance > 0 else 0.0
+        results[model] = MonteCarloResult(s['n'], float(mean), float(np.sqrt(variance)),
+                                          {q: s['histogram'].percentile(q) for q in percentiles},
+                                          sensitivity, s['failed'])
+    return results
@@ -0,0 +1,211 @@
+from collections import namedtuple
+
+import numpy as np
+
+from .models import A, NHNE, hem_flux, spi_flux, dyer_kappa
+from .profiling import stage
+from .saturation import saturation_table
+
+# Pressure (Pa) of every node and mass flow (kg/s) of every element, each shaped like the
+# operating points, whether Newton converged at each point, and the iterations taken
+NetworkSolution = namedtuple('NetworkSolution', 'pressures flows converged iterations')
+
+
+class Network:
+    # Injector feed system as a graph of pressure nodes joined by elements. Sources (tanks)
+    # and sinks (the chamber) have set pressures; every other node is a manifold whose
+    # pressure solve() finds from mass conservation. Elements are feed lines with a loss
+    # coefficient K, m = A sqrt(2 rho dP / K), and groups of N orifices, which follow the
+    # HEM, SPI or NHNE law for a saturable source and SPI for a liquid at fixed density.
+    # Any source, sink or element value may be an array; all of them broadcast together
+    # to the shape of the operating points, e.g.
+    #
+    #   net = Network()
+    #   net.source('tank', T=np.linspace(0, 30, 1000))
+    #   net.sink('chamber', P=20e5)
+    #   net.line('tank', 'manifold', d=8e-3, K=4)
+    #   net.orifices('manifold', 'chamber', N=12, d=1.5e-3, name='outer ring')
+    #   net.orifices('manifold', 'chamber', N=6, d=1.0e-3, name='inner ring')
+    #   solution = net.solve()
+    def __init__(self):
+        self.sources = {}
+        self.sinks = {}
+        self.elements = {}
+
+    def source(self, name, T=None, P=None, rho=None, subst='NitrousOxide'):
+        # A tank of saturated subst at T (C), at its vapour pressure unless a higher
+        # (supercharged) P is given, or, given rho (kg/m^3), of liquid at fixed density and P
+        if rho is None and T is None:
+            raise ValueError(f'source {name!r} needs T, or P and rho for a liquid of fixed density')
+        if rho is not None and P is None:
+            raise ValueError(f'source {name!r} of fixed density needs P')
+        self.sources[name] = dict(T=T, P=P, rho=rho, subst=subst)
+
+    def sink(self, name, P):
+        self.sinks[name] = P
+
+    def line(self, up, down, d, K, name=None):
+        # Feed line or fitting of bore d (m) and total loss coefficient K
+        self._add(name, up, down, dict(kind='line', d=d, K=K))
+
+    def orifices(self, up, down, N, d, Cd=0.66, model='NHNE', kappa=1.4, name=None):
+        # N orifices of diameter d (m); kappa may be 'dyer', taken at the upstream manifold
+        # pressure. model is ignored for liquids of fixed density, which follow SPI.
+        if model not in ('HEM', 'SPI', 'NHNE'):
+            raise ValueError(f"unknown model {model!r}, expected 'HEM', 'SPI' or 'NHNE'")
+        if isinstance(kappa, str) and kappa != 'dyer':
+            raise ValueError(f"unknown kappa {kappa!r}, expected a number or 'dyer'")
+        self._add(name, up, down, dict(kind='orifices', N=N, d=d, Cd=Cd, model=model, kappa=kappa))
+
+    def _add(self, name, up, down, element):
+        name = name or f'{up}->{down}'
+        if name in self.elements:
+            name = f'{name} #{sum(key.startswith(name) for key in self.elements) + 1}'
+        self.elements[name] = dict(element, up=up, down=down)
+
+    def _fluids(self):
+        # Source feeding each node, and each node's distance in elements from its source
+        fluid = {name: name for name in self.sources}
+        depth = {name: 0 for name in self.sources}
+        frontier = list(self.sources)
+        while frontier:
+            node = frontier.pop(0)
+            for element in self.elements.values():
+                if element['up'] != node or element['down'] in self.sinks:
+                    continue
+                down = element['down']
+                if down in self.sources:
+                    raise ValueError(f'element {node!r}->{down!r} flows into a source')
+                if down in fluid and fluid[down] != fluid[node]:
+                    raise ValueError(f'{down!r} is fed by both {fluid[down]!r} and {fluid[node]!r}')
+                if down not in fluid:
+                    fluid[down], depth[down] = fluid[node], depth[node] + 1
+                    frontier.append(down)
+        for element in self.elements.values():
+            if element['up'] not in fluid:
+                raise ValueError(f"{element['up']!r} is not fed by any source")
+        return fluid, depth
+
+    @stage('network solve')
+    def solve(self, rtol=1e-9, iterations=50):
+        # Manifold pressures and element flows at every operating point, by damped Newton
+        # iteration on the mass balance of the manifolds, all points at once. The Jacobian
+        # is taken by forward differences, one extra network evaluation per manifold.
+        # Pressures are kept between the lowest sink and highest source pressure. Converged
+        # where every manifold's imbalance is within rtol of the largest element flow.
+        fluid, depth = self._fluids()
+        manifolds = [node for node in fluid if node not in self.sources]
+        values = [source[key] for source in self.sources.values() for key in ('T', 'P', 'rho')]
+        values += list(self.sinks.values())
+        values += [element[key] for element in self.elements.values()
+                   for key in ('d', 'K', 'N', 'Cd', 'kappa') if key in element]
+        shape = np.broadcast_shapes(*(np.shape(value) for value in values
+                                      if value is not None and not isinstance(value, str)))
+
+        def points(value):
+            return np.broadcast_to(np.asarray(value, dtype=float), shape).ravel()
+
+        size = int(np.prod(shape))
+        sources = {}
+        for name, source in self.sources.items():
+            if source['rho'] is not None:
+                sources[name] = dict(source, P=points(source['P']), rho=points(source['rho']), sat=None)
+            else:
+                sat = saturation_table(source['subst'])
+                T = points(source['T'])
+                P_sat = sat('P', T + 273.15)
+                P = P_sat if source['P'] is None else np.maximum(points(source['P']), P_sat)
+                sources[name] = dict(source, T=T, P=P, sat=sat)
+        sinks = {name: points(P) for name, P in self.sinks.items()}
+        elements = {name: dict(element, **{key: points(value) for key, value in element.items()
+                                           if key in ('d', 'K', 'N', 'Cd', 'kappa') and not isinstance(value, str)})
+                    for name, element in self.elements.items()}
+
+        P_lo = np.min(list(sinks.values()), axis=0) if sinks else np.zeros(size)
+        P_hi = np.max([source['P'] for source in sources.values()], axis=0)
+        # Start each manifold part of the way down from the source, by its depth
+        deepest = max([depth[node] for node in manifolds], default=0) + 1
+        X = np.array([P_hi - (P_hi - P_lo) * depth[node] / deepest for node in manifolds]).reshape(-1, size)
+
+        def evaluate(X):
+            pressure = dict(zip(manifolds, X), **sinks, **{name: source['P'] for name, source in sources.items()})
+            flows = {name: self._flow(element, sources[fluid[element['up']]], pressure[element['up']],
+                                      pressure[element['down']])
+                     for name, element in elements.items()}
+            residual = np.zeros_like(X)
+            index = {node: i for i, node in enumerate(manifolds)}
+            for name, element in elements.items():
+                if element['up'] in index:
+                    residual[index[element['up']]] -= flows[name]
+                if element['down'] in index:
+                    residual[index[element['down']]] += flows[name]
+            scale = np.max(np.abs(list(flows.values())), axis=0) if flows else np.ones(size)
+            return residual, flows, pressure, np.maximum(scale, 1e-300)
+
+        residual, flows, pressure, scale = evaluate(X)
+        error = np.max(np.abs(residual) / scale, axis=0, initial=0)
+        done = 0
+        for done in range(1, iterations + 1):
+            if (error <= rtol).all() or not manifolds:
+                break
+            step = 1e-7 * (P_hi - P_lo) + 1.0
+            J = np.empty((size, len(manifolds), len(manifolds)))
+            for j in range(len(manifolds)):
+                Xj = X.copy()
+                Xj[j] += step
+                J[:, :, j] = ((evaluate(Xj)[0] - residual) / step).T
+            try:
+                dX = np.linalg.solve(J, -residual.T[..., None])[..., 0].T
+            except np.linalg.LinAlgError:
+                dX = (np.linalg.pinv(J) @ -residual.T[..., None])[..., 0].T
+
+            # Halve the step wherever it does not reduce the imbalance
+            alpha = np.ones(size)
+            for _ in range(12):
+                trial = np.clip(X + alpha * dX, P_lo, P_hi)
+                r, f, p, s = evaluate(trial)
+                trial_error = np.max(np.abs(r) / s, axis=0, initial=0)
+                better = (trial_error < error) | (error <= rtol)
+                if better.all():
+                    break
+                alpha = np.where(better, alpha, 0.5 * alpha)
+            X = np.where(better, trial, X)
+            residual, flows, pressure, scale = evaluate(X)
+            error = np.max(np.abs(residual) / scale, axis=0, initial=0)
+
+        return NetworkSolution({node: np.reshape(P, shape) for node, P in pressure.items()},
+                               {name: np.reshape(m, shape) for name, m in flows.items()},
+                               np.reshape(error <= rtol, shape), done)
+
+    @staticmethod
+    def _flow(element, source, P_up, P_down):
+        # Mass flow (kg/s) from P_up to P_down. A saturable liquid whose pressure has fallen
+        # below the source's vapour pressure is taken as saturated at that pressure, which
+        # keeps every law continuous down to zero flow. Lines pass flow either way; orifices
+        # pass none against the pressure drop.
+        if source['sat'] is None:
+            rho, T = source['rho'], None
+        else:
+            sat = source['sat']
+            T = np.fmin(source['T'] + 273.15, sat.T_sat(P_up)) - 273.15
+            rho = sat('Dl', T + 273.15)
+
+        with np.errstate(invalid='ignore'):
+            if element['kind'] == 'line':
+                # A line of loss coefficient K passes what an orifice with Cd = 1 / sqrt(K) does
+                G = spi_flux(rho, P_up, P_down) - spi_flux(rho, P_down, P_up)
+                return A(element['d']) / np.sqrt(element['K']) * G
+
+            area = element['N'] * element['Cd'] * A(element['d'])
+            G_SPI = spi_flux(rho, P_up, P_down)
+            if T is None or element['model'] == 'SPI':
+                return area * G_SPI
+            G_HEM = hem_flux(T, P_down, source['subst'])
+            if element['model'] == 'HEM':
+                G = G_HEM
+            else:
+                kappa = element['kappa']
+                if isinstance(kappa, str):
+                    kappa = dyer_kappa(T, P_down, P_up, source['subst'])
+                G = NHNE(G_SPI, G_HEM, kappa)
+        return np.where(P_up > P_down, area * G, 0.0)
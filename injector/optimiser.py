@@ -0,0 +1,51 @@
+from collections import namedtuple
+
+import numpy as np
+
+from .fluxmaps import flux_map
+from .models import A
+from .profiling import stage
+
+# Metric jobber drill sizes (m), 0.1 mm steps from 0.5 to 6 mm
+DRILL_SIZES = np.round(np.arange(0.5, 6.01, 0.1), 1) / 1000
+# Objectives over the envelope, of the relative mass-flow deviation m / m_target - 1
+OBJECTIVES = {
+    'rms': lambda deviation: np.sqrt(np.mean(deviation ** 2, axis=-1)),
+    'max': lambda deviation: np.max(np.abs(deviation), axis=-1),
+}
+
+# One candidate geometry and its mass flow (kg/s) over the envelope; deviation is the objective
+Geometry = namedtuple('Geometry', 'N d Cd deviation m_mean m_min m_max')
+
+
+@stage('optimise_geometry')
+def optimise_geometry(m_target=1.36, T=np.linspace(0, 30, 31), Pc=np.linspace(15e5, 25e5, 11), N=np.arange(1, 51),
+                      d=DRILL_SIZES, Cd=np.linspace(0.6, 0.8, 21), model='NHNE', kappa=1.4, objective='rms',
+                      n_best=10, population=4096, subst='NitrousOxide', fluxes=None):
+    # Orifice count, drill diameter (m) and expected Cd that keep the mass flow closest to
+    # m_target (kg/s) over every combination of tank temperature T (C) and chamber pressure
+    # Pc (Pa), by the 'rms' or 'max' relative deviation. N, d and Cd are the allowed values,
+    # searched exhaustively. The model's flux over the envelope is interpolated once from the
+    # flux map (flux_map() unless given), then every population of candidates is one array
+    # product, m = N * Cd * A(d) * G. Envelope points where the model gives no flow count as
+    # zero flow; the envelope must lie within the flux map. Returns the n_best candidates as
+    # Geometry, best first.
+    if objective not in OBJECTIVES:
+        raise ValueError(f"unknown objective {objective!r}, expected one of {', '.join(OBJECTIVES)}")
+    fluxes = flux_map(subst=subst) if fluxes is None else fluxes
+    T, Pc = np.meshgrid(np.atleast_1d(T), np.atleast_1d(Pc), indexing='ij')
+    G = fluxes.flux(model, T.ravel(), Pc.ravel(), kappa)
+    if np.isnan(G).any():
+        raise ValueError('the T and Pc envelope reaches outside the flux map')
+
+    N, d, Cd = (np.ravel(value) for value in np.meshgrid(np.atleast_1d(N), np.atleast_1d(d), np.atleast_1d(Cd),
+                                                        indexing='ij'))
+    area = N * Cd * A(d)
+    score = np.empty(area.size)
+    for start in range(0, area.size, population):
+        m = area[start:start + population, None] * G
+        score[start:start + population] = OBJECTIVES[objective](m / m_target - 1)
+
+    best = np.argsort(score, kind='stable')[:n_best]
+    return [Geometry(int(N[i]), float(d[i]), float(Cd[i]), float(score[i]), float(area[i] * G.mean()),
+                     float(area[i] * G.min()), float(area[i] * G.max())) for i in best]
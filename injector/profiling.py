@@ -0,0 +1,156 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import ContextDecorator, contextmanager
+
+import numpy as np
+
+# Opt-in profiling of property evaluations and model stages. Nothing is recorded unless a
+# profile is running: use `with profile() as p:`, or set SUNFIRE_PROFILE=trace.json to
+# profile the whole process and write the trace (and a summary on stderr) at exit.
+# Input pairs are named in this order, e.g. 'T-Q', 'P-S', 'P-T'
+PAIR_ORDER = 'PTDHSQU'
+
+_active = None
+_lock = threading.Lock()
+
+
+class Profile:
+    # Calls, states evaluated and seconds per (input pair, substance) of property evaluations
+    # (injector.properties and any direct PropsSI calls), calls and seconds per stage, and a
+    # Chrome trace event for each (up to max_events)
+    def __init__(self, max_events=10**6):
+        self.properties = {}
+        self.stages = {}
+        self.events = []
+        self.max_events = max_events
+        self.start = time.perf_counter()
+
+    def _record(self, table, key, seconds, points, event):
+        with _lock:
+            entry = table.setdefault(key, [0, 0, 0.0])
+            entry[0] += 1
+            entry[1] += points
+            entry[2] += seconds
+            if len(self.events) < self.max_events:
+                self.events.append(event)
+
+    def _event(self, name, category, t0, t1, **args):
+        return {'name': name, 'cat': category, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                'ts': (t0 - self.start) * 1e6, 'dur': (t1 - t0) * 1e6, 'args': args}
+
+    def summary(self):
+        # Table of stages and property calls, slowest first
+        lines = [f"{'stage':40s} {'calls':>8s} {'total ms':>10s} {'mean ms':>10s}"]
+        for name, (calls, _, seconds) in sorted(self.stages.items(), key=lambda item: -item[1][2]):
+            lines.append(f'{name:40s} {calls:8d} {seconds * 1000:10.2f} {seconds * 1000 / calls:10.3f}')
+        lines.append('')
+        lines.append(f"{'property pair':16s} {'substance':27s} {'calls':>8s} {'states':>10s} {'total ms':>10s} {'us/state':>9s}")
+        for (pair, subst), (calls, points, seconds) in sorted(self.properties.items(), key=lambda item: -item[1][2]):
+            lines.append(f'{pair:16s} {subst:27s} {calls:8d} {points:10d} {seconds * 1000:10.2f} '
+                         f'{seconds * 1e6 / max(points, 1):9.2f}')
+        return '\n'.join(lines)
+
+    def write_trace(self, path):
+        # Chrome trace event JSON, for chrome://tracing, Perfetto or speedscope
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+
+def pair_names(name1, name2):
+    return sorted((str(name1), str(name2)), key=lambda name: PAIR_ORDER.find(name[:1].upper()))
+
+
+def _pair(args):
+    # Input pair and substance of a PropsSI call; the two-argument form reads a constant
+    if len(args) == 2:
+        return 'constant', str(args[0])
+    return '-'.join(pair_names(args[1], args[3])), str(args[5])
+
+
+def record_properties(pair, subst, t0, t1, points, output):
+    # Record a property evaluation of `points` states that ran from t0 to t1 (perf_counter)
+    profile = _active
+    if profile is not None:
+        profile._record(profile.properties, (pair, subst), t1 - t0, points,
+                        profile._event(f'properties {pair}', 'coolprop', t0, t1, output=output,
+                                       subst=subst, states=points))
+
+
+def _profiled(PropsSI):
+    def profiled_PropsSI(*args):
+        t0 = time.perf_counter()
+        result = PropsSI(*args)
+        pair, subst = _pair(args)
+        record_properties(pair, subst, t0, time.perf_counter(), int(np.size(result)), str(args[0]))
+        return result
+    profiled_PropsSI.unprofiled = PropsSI
+    return profiled_PropsSI
+
+
+def start(max_events=10**6):
+    # Start recording into a new Profile and return it. Imports CoolProp to wrap PropsSI.
+    global _active
+    import CoolProp.CoolProp as CP
+    if not hasattr(CP.PropsSI, 'unprofiled'):
+        CP.PropsSI = _profiled(CP.PropsSI)
+    _active = Profile(max_events)
+    return _active
+
+
+def stop():
+    # Stop recording and return the finished Profile
+    global _active
+    profile, _active = _active, None
+    CP = sys.modules.get('CoolProp.CoolProp')
+    if CP is not None and hasattr(CP.PropsSI, 'unprofiled'):
+        CP.PropsSI = CP.PropsSI.unprofiled
+    return profile
+
+
+@contextmanager
+def profile(max_events=10**6):
+    result = start(max_events)
+    try:
+        yield result
+    finally:
+        stop()
+
+
+class stage(ContextDecorator):
+    # Time a block or function as a named stage of the running profile, e.g. @stage('HEM_CP')
+    # or `with stage('draw'):`. Costs one attribute check when no profile is running.
+    def __init__(self, name):
+        self.name = name
+        self.t0 = None
+
+    def _recreate_cm(self):
+        return stage(self.name)  # decorated functions get a fresh timer per call
+
+    def __enter__(self):
+        if _active is not None:
+            self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        profile = _active
+        if profile is not None and self.t0 is not None:
+            t1 = time.perf_counter()
+            profile._record(profile.stages, self.name, t1 - self.t0, 0,
+                            profile._event(self.name, 'stage', self.t0, t1))
+        return False
+
+
+if os.environ.get('SUNFIRE_PROFILE'):
+    _trace_path = os.environ['SUNFIRE_PROFILE']
+    start()
+
+    def _write_at_exit():
+        finished = stop()
+        finished.write_trace(_trace_path)
+        print(finished.summary(), file=sys.stderr)
+        print(f'trace written to {_trace_path}', file=sys.stderr)
+    atexit.register(_write_at_exit)
@@ -0,0 +1,200 @@
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from . import profiling
+
+# Single entry point for fluid properties. Every state is evaluated on a CoolProp
+# AbstractState that is created once per thread, substance and backend and reused. The
+# backend is HEOS (the full Helmholtz equation of state) unless SUNFIRE_BACKEND or
+# set_backend() picks one of the tabulated backends, which interpolate tables built from
+# HEOS and are several times faster per state at some loss of accuracy; `python -m
+# injector.properties` reports the trade-off over the injector operating envelope.
+BACKENDS = ('HEOS', 'BICUBIC&HEOS', 'TTSE&HEOS')
+# Per-point status codes, described by STATUS
+OK, FAILED, SKIPPED, SCALED, OUTSIDE = range(5)
+STATUS = ('ok', 'CoolProp failed', 'skipped, CoolProp failed on it before', 'near-critical scaling law',
+          'outside the table')
+# Failed states remembered per backend, substance and input pair
+MAX_FAILURES = 100_000
+
+_backend = os.environ.get('SUNFIRE_BACKEND', 'HEOS')
+_local = threading.local()
+_pairs = {}
+_parameters = {}
+_failures = {}
+
+
+def set_backend(backend):
+    # Backend for every later property evaluation and table build in this process, and in
+    # worker processes started after it (through SUNFIRE_BACKEND)
+    global _backend
+    if backend not in BACKENDS:
+        raise ValueError(f'unknown backend {backend!r}, expected one of {", ".join(BACKENDS)}')
+    _backend = os.environ['SUNFIRE_BACKEND'] = backend
+
+
+def get_backend():
+    if _backend not in BACKENDS:
+        raise ValueError(f'unknown SUNFIRE_BACKEND {_backend!r}, expected one of {", ".join(BACKENDS)}')
+    return _backend
+
+
+def state(subst='NitrousOxide', backend=None):
+    # This thread's AbstractState for subst; a tabulated backend builds (or loads) its tables
+    # on first use
+    import CoolProp.CoolProp as CP
+    key = (backend or get_backend(), subst)
+    states = _local.__dict__.setdefault('states', {})
+    if key not in states:
+        states[key] = CP.AbstractState(*key)
+    return states[key]
+
+
+def _parameter(name):
+    if name not in _parameters:
+        import CoolProp.CoolProp as CP
+        _parameters[name] = CP.get_parameter_index(name)
+    return _parameters[name]
+
+
+def _input_pair(name1, name2):
+    # CoolProp input pair for two input names, and whether their values need swapping
+    if (name1, name2) not in _pairs:
+        import CoolProp.CoolProp as CP
+        pair, first, _ = CP.generate_update_pair(_parameter(name1), 1.0, _parameter(name2), 2.0)
+        _pairs[name1, name2] = (pair, first == 2.0)
+    return _pairs[name1, name2]
+
+
+def props(outputs, name1, value1, name2, value2, subst='NitrousOxide', backend=None, status=False):
+    # Property or properties (a name or a tuple of names, as for PropsSI) at the states given
+    # by two inputs, which broadcast together. Every output is read from one update of the
+    # state, so asking for several at once costs no more flashes. States CoolProp cannot
+    # evaluate are NaN, and are remembered so that asking again (e.g. the same isoline on
+    # every slider move) does not repeat the failing flash, which near the critical point
+    # can take milliseconds. Returns an array, or a tuple of arrays for a tuple of outputs,
+    # followed by an array of per-point status codes (OK, FAILED or SKIPPED) if status.
+    backend = backend or get_backend()
+    single = isinstance(outputs, str)
+    outputs = (outputs,) if single else tuple(outputs)
+    pair, swap = _input_pair(name1, name2)
+    a, b = np.broadcast_arrays(np.asarray(value1, dtype=float), np.asarray(value2, dtype=float))
+    if swap:
+        a, b = b, a
+    AS = state(subst, backend)
+    keys = [_parameter(output) for output in outputs]
+    values = np.full((len(keys), a.size), np.nan)
+    codes = np.zeros(a.size, dtype=np.int8)
+    failures = _failures.setdefault((backend, subst, pair), set())
+
+    t0 = time.perf_counter()
+    for i, (x, y) in enumerate(zip(a.ravel().tolist(), b.ravel().tolist())):
+        if (x, y) in failures:
+            codes[i] = SKIPPED
+            continue
+        try:
+            AS.update(pair, x, y)
+            values[:, i] = [AS.keyed_output(key) for key in keys]
+        except ValueError:
+            codes[i] = FAILED
+            if len(failures) < MAX_FAILURES:
+                failures.add((x, y))
+    t1 = time.perf_counter()
+    profiling.record_properties('-'.join(profiling.pair_names(name1, name2)), f'{backend}::{subst}',
+                                t0, t1, a.size, ','.join(outputs))
+
+    values = values.reshape((len(keys),) + a.shape)
+    values = values[0] if single else tuple(values)
+    return (values, codes.reshape(a.shape)) if status else values
+
+
+def clear_failures():
+    # Forget the remembered failed states, e.g. after changing CoolProp settings
+    _failures.clear()
+
+
+def constant(subst, name):
+    # Trivial fluid constant such as 'Tmin', 'Tcrit', 'Pcrit' or 'rhocrit', from HEOS
+    return state(subst, 'HEOS').trivial_keyed_output(_parameter(name))
+
+
+# Outputs compared by the backend report, and the envelope: tank temperatures from -20 C to
+# just below critical and pressures of 5 to 60 bar
+REPORT_OUTPUTS = ('D', 'H')
+REPORT_T = (253.15, -0.5)
+REPORT_P = (5e5, 60e5)
+
+
+def _report_cases(subst, n, seed):
+    # (name, input names, first values, second values) of each class of injector state
+    rng = np.random.default_rng(seed)
+    T_crit = constant(subst, 'Tcrit')
+    T = rng.uniform(REPORT_T[0], T_crit + REPORT_T[1], n)
+    P_sat, s_l = props(('P', 'S'), 'T', T, 'Q', 0, subst, 'HEOS')
+    return [
+        ('saturated liquid', ('T', 'Q'), T, np.zeros(n)),
+        ('saturated vapour', ('T', 'Q'), T, np.ones(n)),
+        ('compressed liquid', ('T', 'P'), T, P_sat + rng.uniform(0.5e5, 30e5, n)),
+        ('isentropic expansion', ('P', 'S'), rng.uniform(*REPORT_P, n), s_l),
+    ]
+
+
+def _init_time(backend, subst):
+    # Seconds to create the first state of backend in a fresh interpreter. The tabulated
+    # backends share their tables within a process, so timing them here would charge the
+    # whole build to whichever ran first.
+    import subprocess
+    code = ('import time, CoolProp.CoolProp as CP; t = time.perf_counter(); '
+            f'CP.AbstractState({backend!r}, {subst!r}); print(time.perf_counter() - t)')
+    return float(subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                check=True).stdout)
+
+
+def backend_report(backends=BACKENDS, subst='NitrousOxide', n=2000, seed=0):
+    # Speed and accuracy of each backend on n random states of each class in _report_cases:
+    # {backend: (init seconds, {case: (us per state, median and max relative error against
+    # HEOS over REPORT_OUTPUTS, failed states)})}. The initial time is that of creating the
+    # first state in a fresh process, which for tabulated backends builds their tables or
+    # loads them from CoolProp's own disk cache.
+    cases = _report_cases(subst, n, seed)
+    exact = [props(REPORT_OUTPUTS, name1, x, name2, y, subst, 'HEOS') for _, (name1, name2), x, y in cases]
+
+    report = {}
+    for backend in backends:
+        init = _init_time(backend, subst)
+        state(subst, backend)
+        rows = {}
+        report[backend] = (init, rows)
+        for (name, (name1, name2), x, y), reference in zip(cases, exact):
+            t = time.perf_counter()
+            values = props(REPORT_OUTPUTS, name1, x, name2, y, subst, backend)
+            seconds = time.perf_counter() - t
+            with np.errstate(invalid='ignore', divide='ignore'):
+                error = np.max([np.abs(v / r - 1) for v, r in zip(values, reference)], axis=0)
+            valid = np.isfinite(error)
+            error = error[valid] if valid.any() else np.array([np.nan])
+            rows[name] = (seconds * 1e6 / n, float(np.median(error)), float(error.max()), int(n - valid.sum()))
+    return report
+
+
+def print_report(report):
+    for backend, (init, rows) in report.items():
+        print(f'{backend} (init {init * 1000:.0f} ms)')
+        print(f"  {'states':22s} {'us/state':>9s} {'median':>10s} {'max':>10s} {'failed':>7s}")
+        for name, (us, median, worst, failed) in rows.items():
+            print(f'  {name:22s} {us:9.2f} {median:10.2e} {worst:10.2e} {failed:7d}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m injector.properties',
+                                     description='Speed and accuracy of the CoolProp backends over the injector envelope')
+    parser.add_argument('--backends', nargs='+', default=BACKENDS, choices=BACKENDS)
+    parser.add_argument('--subst', default='NitrousOxide')
+    parser.add_argument('--points', type=int, default=2000, help='random states per class of state')
+    args = parser.parse_args()
+    print_report(backend_report(args.backends, args.subst, args.points))
@@ -0,0 +1,199 @@
+import math
+
+import numpy as np
+
+from .cache import cached, fluid_constant
+from .properties import OK, SCALED, OUTSIDE, get_backend, props
+from .profiling import stage
+
+# Tabulated saturation properties, each column is (CoolProp output, quality)
+COLUMNS = {
+    'P': ('P', 0),   # saturation pressure (Pa)
+    'Dl': ('D', 0),  # liquid density (kg/m^3)
+    'Dv': ('D', 1),  # vapour density (kg/m^3)
+    'Hl': ('H', 0),  # liquid enthalpy (J/kg)
+    'Hv': ('H', 1),  # vapour enthalpy (J/kg)
+    'Sl': ('S', 0),  # liquid entropy (J/kg/K)
+    'Sv': ('S', 1),  # vapour entropy (J/kg/K)
+}
+# Strictly positive columns are tabulated as logarithms, so their error is relative
+LOG_COLUMNS = ('P', 'Dl', 'Dv')
+# Liquid and vapour columns fitted near the critical point as a mean and half-difference
+SCALED_PAIRS = (('Dl', 'Dv'), ('Hl', 'Hv'), ('Sl', 'Sv'))
+# Within this many K of the critical point the table is built from HEOS whatever the
+# backend, the tabulated backends are off by percent there
+HEOS_BAND = 1.0
+
+
+class SaturationTable:
+    # Saturation curve of subst from Tmin to Tcrit, built once and queried with np.interp.
+    # The grid is bisected until linear interpolation at every cell midpoint is within rtol
+    # (relative for P and densities, relative to the column span for h and s), or the cell
+    # is narrower than dT_min. Built tables are kept in the persistent property cache.
+    #
+    # Within T_crit - T_scaling of the critical point, where the liquid and vapour branches
+    # meet with infinite slope and linear interpolation needs ever finer cells, each pair
+    # of columns follows a fitted scaling law instead: a mean that is quadratic in
+    # tau = 1 - T / T_crit and a half-difference of b tau^beta exp(c tau + d tau^2), with
+    # beta fitted too; ln P is quadratic in tau. The band starts dT_scaling wide and is
+    # halved until the law is within rtol (relative) of HEOS, which is always used within
+    # HEOS_BAND of the critical point, where the tabulated backends are least accurate.
+    # The law is fitted and checked down to tau = 1e-7 (about 3e-5 K for N2O), closer than
+    # which HEOS flashes themselves scatter by around 1e-5.
+    def __init__(self, subst='NitrousOxide', rtol=1e-5, n_start=65, dT_min=1e-4, dT_scaling=0.1):
+        self.subst = subst
+        self.rtol = rtol
+        self.T_min = fluid_constant(subst, 'Tmin') + 0.01  # slightly above the minimum temperature
+        self.T_crit = fluid_constant(subst, 'Tcrit')
+
+        table = cached('saturation', lambda: self._build(n_start, dT_min, dT_scaling), subst=subst,
+                       backend=get_backend(), pair='T-Q', T_min=self.T_min, rtol=rtol, n_start=n_start,
+                       dT_min=dT_min, dT_scaling=dT_scaling, heos_band=HEOS_BAND)
+        # Plain views of the memory-mapped arrays, numpy.memmap adds overhead to every lookup
+        self.T = np.asarray(table['T'])
+        self.T_scaling = float(table['T_scaling'])
+        self.max_error = float(table['max_error'])
+        self._columns = {key: np.asarray(table[key]) for key in COLUMNS}
+        self._set_scaling(table['scaling'])
+
+        # Saturation pressure through the band, for inverting with T_sat
+        band = np.linspace(self.T_scaling, self.T_crit, 65)[1:]
+        self._T_lookup = np.concatenate([self.T, band])
+        self._lnP_lookup = np.concatenate([self._columns['P'], np.log(self._scaled('P', band))])
+
+    @stage('saturation table build')
+    def _build(self, n_start, dT_min, dT_scaling):
+        rtol = self.rtol
+        T_scaling, scaling, scaling_error = self._fit_scaling(dT_scaling, dT_min)
+        T = np.linspace(self.T_min, T_scaling, n_start)
+        values = self._flash(T)
+        scale = np.array([[1.0] if key in LOG_COLUMNS else [np.ptp(column)] for key, column in zip(COLUMNS, values)])
+
+        lo, hi = T[:-1], T[1:]
+        errors = []
+        while lo.size:
+            Tm = 0.5 * (lo + hi)
+            exact = self._flash(Tm)
+            linear = np.array([np.interp(Tm, T, column) for column in values])
+            err = (np.abs(linear - exact) / scale).max(axis=0)
+
+            split = (err > rtol) & (hi - lo > 2 * dT_min)
+            errors.append(err[~split])
+
+            order = np.argsort(np.concatenate([T, Tm[split]]))
+            T = np.concatenate([T, Tm[split]])[order]
+            values = np.concatenate([values, exact[:, split]], axis=1)[:, order]
+            lo, hi = np.concatenate([lo[split], Tm[split]]), np.concatenate([Tm[split], hi[split]])
+
+        return dict(zip(COLUMNS, values), T=T, T_scaling=T_scaling, scaling=scaling,
+                    max_error=max(np.concatenate(errors).max(), scaling_error))
+
+    def _flash(self, T, backend=None, log=True):
+        # One flash per quality, reading every column at that quality from it
+        near = T > self.T_crit - HEOS_BAND
+        flashed = {}
+        for Q in (0, 1):
+            outputs = tuple(output for output, quality in COLUMNS.values() if quality == Q)
+            values = np.empty((len(outputs), T.size))
+            for points, points_backend in ((~near, backend), (near, 'HEOS')):
+                if points.any():
+                    values[:, points] = props(outputs, 'T', T[points], 'Q', Q, self.subst, points_backend)
+            flashed.update(zip(((output, Q) for output in outputs), values))
+        values = [flashed[column] for column in COLUMNS.values()]
+        return np.array([np.log(v) if log and key in LOG_COLUMNS else v for key, v in zip(COLUMNS, values)])
+
+    def _fit_scaling(self, dT, dT_min, n=32):
+        # (T_scaling, coefficients, max relative error) of the near-critical scaling law.
+        # Coefficient rows are ln P, then the mean and half-difference of each pair in
+        # SCALED_PAIRS; polynomial rows are padded with zeros, and half-difference rows are
+        # (ln b, beta, c, d, sign of the difference).
+        while True:
+            tau = np.geomspace(1e-7, dT / self.T_crit, n)
+            values = dict(zip(COLUMNS, self._flash(self.T_crit * (1 - tau), 'HEOS', log=False)))
+            poly = np.stack([np.ones(n), tau, tau ** 2], axis=1)
+            power = np.stack([np.ones(n), np.log(tau), tau, tau ** 2], axis=1)
+
+            rows = [np.append(np.linalg.lstsq(poly, np.log(values['P']), rcond=None)[0], [0, 0])]
+            for liquid, vapour in SCALED_PAIRS:
+                mean = 0.5 * (values[liquid] + values[vapour])
+                half = 0.5 * (values[vapour] - values[liquid])
+                rows.append(np.append(np.linalg.lstsq(poly, mean, rcond=None)[0], [0, 0]))
+                rows.append(np.append(np.linalg.lstsq(power, np.log(np.abs(half)), rcond=None)[0], np.sign(half[-1])))
+            self._set_scaling(np.array(rows))
+
+            # Check between the fitted points
+            T = self.T_crit * (1 - np.sqrt(tau[:-1] * tau[1:]))
+            exact = self._flash(T, 'HEOS', log=False)
+            error = np.nanmax(np.abs(np.array([self._scaled(key, T) for key in COLUMNS]) / exact - 1))
+            if error <= self.rtol or dT / 2 < dT_min:
+                return self.T_crit - dT, np.array(rows), error
+            dT /= 2
+
+    def _set_scaling(self, rows):
+        # Coefficients of each column's scaling law as floats: the mean's polynomial, then
+        # the half-difference's, signed towards this column
+        rows = np.asarray(rows, dtype=float)
+        self._laws = {'P': (tuple(rows[0, :3]), None)}
+        for pair, columns in enumerate(SCALED_PAIRS):
+            ln_b, beta, c, d, sign = rows[2 + 2 * pair]
+            for column, side in zip(columns, (-sign, sign)):
+                self._laws[column] = (tuple(rows[1 + 2 * pair, :3]), (ln_b, beta, c, d, side))
+
+    def _scaled(self, key, T):
+        tau = np.maximum(1 - T / self.T_crit, 1e-300)  # 0 at T_crit
+        (a0, a1, a2), half = self._laws[key]
+        mean = a0 + tau * (a1 + tau * a2)
+        if half is None:
+            return np.exp(mean)  # ln P
+        ln_b, beta, c, d, side = half
+        return mean + side * np.exp(ln_b + beta * np.log(tau) + tau * (c + tau * d))
+
+    def _scaled_point(self, key, T):
+        # _scaled for one temperature in floats, many times faster than on a 1-element array
+        tau = max(1 - T / self.T_crit, 1e-300)
+        (a0, a1, a2), half = self._laws[key]
+        mean = a0 + tau * (a1 + tau * a2)
+        if half is None:
+            return math.exp(mean)
+        ln_b, beta, c, d, side = half
+        return mean + side * math.exp(ln_b + beta * math.log(tau) + tau * (c + tau * d))
+
+    def __call__(self, key, T):
+        # Saturation property `key` at temperature(s) T (K), NaN outside [T_min, T_crit]
+        T = np.asarray(T, dtype=float)
+        value = np.interp(T, self.T, self._columns[key], left=np.nan, right=np.nan)
+        value = np.exp(value) if key in LOG_COLUMNS else value
+        if T.max(initial=-np.inf) > self.T_scaling:
+            band = np.flatnonzero((T > self.T_scaling) & (T <= self.T_crit))
+            value = np.array(value)
+            flat, T = value.reshape(-1), T.reshape(-1)
+            if band.size <= 8:
+                # Typically only the end of a grid that runs up to T_crit
+                for i in band.tolist():
+                    flat[i] = self._scaled_point(key, float(T[i]))
+            else:
+                flat[band] = self._scaled(key, T[band])
+            value = value[()]
+        return value
+
+    def status(self, T):
+        # Per-point status of lookups at T (K): OK from the table, SCALED from the
+        # near-critical scaling law, OUTSIDE (NaN) beyond [T_min, T_crit]
+        T = np.asarray(T, dtype=float)
+        return np.where((T >= self.T[0]) & (T <= self.T_scaling), OK,
+                        np.where((T > self.T_scaling) & (T <= self.T_crit), SCALED, OUTSIDE))
+
+    def T_sat(self, P):
+        # Saturation temperature (K) at pressure(s) P (Pa)
+        return np.interp(np.log(P), self._lnP_lookup, self._T_lookup, left=np.nan, right=np.nan)
+
+
+_tables = {}
+
+
+def saturation_table(subst='NitrousOxide'):
+    # Shared table per substance and backend, built on first use
+    key = (subst, get_backend())
+    if key not in _tables:
+        _tables[key] = SaturationTable(subst)
+    return _tables[key]
@@ -0,0 +1,89 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from .models import AXES, MODELS, FlowGrid, mass_flow_grid
+from .properties import get_backend
+
+GRID_FILE = 'grid.npz'
+SETTINGS_FILE = 'sweep.json'
+
+
+def _chunk_file(path, index):
+    return os.path.join(path, f'chunk_{index:05d}.npz')
+
+
+def _run_chunk(path, index, grid, subst, models):
+    # Runs in a worker process, which builds its own property tables and CoolProp state
+    flows = mass_flow_grid(subst=subst, models=models, **grid)
+    tmp = _chunk_file(path, index) + '.tmp.npz'
+    np.savez(tmp, values=flows.values, T=grid['T'])
+    os.replace(tmp, _chunk_file(path, index))  # chunks only appear once complete
+    return index
+
+
+def run_sweep(path, T, Pc, d, N=12, Cd=0.66, kappa=1.4, subst='NitrousOxide', models=MODELS,
+              chunk_size=16, workers=None):
+    # Evaluate mass_flow_grid over the full (T, Pc, d, N, Cd, kappa) design space, split into
+    # chunks of chunk_size temperatures that run in a process pool and are written to
+    # path/chunk_#####.npz as they finish. Rerunning with the same grid resumes the sweep,
+    # skipping chunks already on disk. Returns the number of chunks computed. kappa must be
+    # numeric, since the grid is saved as floats to recognise the sweep when it resumes.
+    if any(isinstance(value, str) for value in np.atleast_1d(np.asarray(kappa, dtype=object))):
+        raise ValueError(f'run_sweep needs numeric kappa, got {kappa!r}; '
+                         "sweep kappa values or use mass_flow_grid(..., kappa='dyer', P1=...) directly")
+    grid = {name: np.atleast_1d(np.asarray(value, dtype=float))
+            for name, value in dict(T=T, Pc=Pc, d=d, N=N, Cd=Cd, kappa=kappa).items()}
+    settings = {'subst': subst, 'models': list(models), 'chunk_size': chunk_size, 'backend': get_backend()}
+
+    os.makedirs(path, exist_ok=True)
+    grid_file, settings_file = os.path.join(path, GRID_FILE), os.path.join(path, SETTINGS_FILE)
+    if os.path.exists(settings_file):
+        with open(settings_file) as f:
+            saved = json.load(f)
+        with np.load(grid_file) as saved_grid:
+            same_grid = all(np.array_equal(saved_grid[name], grid[name]) for name in grid)
+        if dict({'backend': 'HEOS'}, **saved) != settings or not same_grid:  # older sweeps are HEOS
+            raise ValueError(f'{path} holds a different sweep, use a new directory to start another')
+    else:
+        np.savez(grid_file, **grid)
+        with open(settings_file, 'w') as f:
+            json.dump(settings, f)
+
+    starts = range(0, len(grid['T']), chunk_size)
+    todo = [(index, start) for index, start in enumerate(starts) if not os.path.exists(_chunk_file(path, index))]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_chunk, path, index, dict(grid, T=grid['T'][start:start + chunk_size]), subst, models)
+                   for index, start in todo]
+        for future in as_completed(futures):
+            future.result()
+    return len(todo)
+
+
+def sweep_progress(path):
+    # (completed, total) chunk counts of the sweep in path
+    with open(os.path.join(path, SETTINGS_FILE)) as f:
+        chunk_size = json.load(f)['chunk_size']
+    with np.load(os.path.join(path, GRID_FILE)) as grid:
+        total = -(-len(grid['T']) // chunk_size)
+    return sum(os.path.exists(_chunk_file(path, index)) for index in range(total)), total
+
+
+def load_sweep(path):
+    # FlowGrid of a completed sweep, with every axis of AXES kept
+    done, total = sweep_progress(path)
+    if done < total:
+        raise RuntimeError(f'{path} has {done} of {total} chunks, rerun run_sweep to finish it')
+    with open(os.path.join(path, SETTINGS_FILE)) as f:
+        models = tuple(json.load(f)['models'])
+    with np.load(os.path.join(path, GRID_FILE)) as grid:
+        coords = {name: grid[name] for name in AXES[1:]}
+
+    chunks = []
+    for index in range(total):
+        with np.load(_chunk_file(path, index)) as chunk:
+            chunks.append(chunk['values'])
+    coords['model'] = models
+    return FlowGrid(np.concatenate(chunks, axis=1), AXES, coords)